@@ -1,77 +1,202 @@
+import os
+import time
+import numpy as np
 import pandas as pd
 import streamlit as st
-import tempfile
-from PyPDF2 import PdfReader
-import plotly.express as px
+
+from archives import MAX_UNCOMPRESSED_BYTES, ArchiveMember, expand_uploads
+from cache import ExtractionCache
+from backends import PDF_BACKENDS
+from charts import contribution_pie, monthly_bar, per_file_bar, top_products_bar
+from dedup import DocumentIndex
+from isolation import Quarantine, WorkerLimits
+from export import EXCEL_MIME, export_excel
+from parallel import default_workers
+from pipeline import ExtractionJob
+from profiling import NULL_PROFILER, Profiler
+from session import BatchSession, upload_keys
+from stats import get_statistics
+from store import ReceiptStore
 
 st.set_page_config(layout="wide")
 
-def extract_data_from_pdf(uploaded_file):
-    # Inicializar variáveis para armazenar dados e valor total
-    data = []
-    total_value = 0
-
-    # Salvar o arquivo temporariamente
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        temp_file.write(uploaded_file.read())
-        temp_file.seek(0)
-
-        # Usar PdfReader para ler o PDF
-        pdf_reader = PdfReader(temp_file.name)
-
-        # Iterar sobre todas as páginas do PDF
-        for page in pdf_reader.pages:
-            # Extrair texto da página atual
-            text = page.extract_text()
-
-            # Processar o texto extraído para obter os dados da tabela
-            lines = text.split('\n')
-
-            # Encontrar o índice de início das linhas de dados
-            start_index = None
-            for line_index, line in enumerate(lines):
-                if "Item Descrição Qtde. Unid. Vl. unid. Vl. total" in line:
-                    start_index = line_index + 1
-                    break
-
-            # Iterar sobre as linhas de dados e preencher as colunas
-            last_item = None  # Último item processado
-            for line in lines[start_index:]:
-                if line.strip():
-                    fields = line.split()
-                    if len(fields) >= 6 and fields[0].isdigit():
-                        item = fields[0]
-                        if len(item) == 3 and item.isdigit():
-                            if last_item is not None:
-                                # Verificar se o próximo item é sequencial ao último item processado
-                                next_item = int(item)
-                                if next_item != last_item + 1:
-                                    # Se não for sequencial, não processar a linha
-                                    continue
-                        descricao = ' '.join(fields[1:-4])
-                        qtde = fields[-4]
-                        unidade = fields[-3]
-                        vl_unidade = fields[-2]
-                        vl_total = fields[-1]
-                        try:
-                            vl_total_float = float(vl_total.replace(',', '.'))  # Converta o valor total para float
-                            total_value += vl_total_float  # Adicionar o valor total
-                        except ValueError:
-                            pass  # Ignorar valores não numéricos
-                        data.append([item, descricao, qtde, unidade, vl_unidade, vl_total])
-
-                        # Comentar a linha abaixo para evitar a duplicação da última linha
-                        # data.append(['', '', '', '', '', f'Total: {total_value:.2f}'])
-
-                        last_item = int(item)
-
-    # Adicionar uma linha com o valor total
-    # data.append(['', '', '', '', '', f'Total: {total_value:.2f}'])
-
-    # Filtrar linhas com item vazio
-    data_filtered = [row for row in data if row[0] != '']
-            
-    return data_filtered, total_value
+# Intervalo entre as atualizações da tela durante a extração em segundo plano
+PROGRESS_POLL_SECONDS = 0.5
+
+# Leitor de PDF escolhido pela calibração em uma amostra dos primeiros uploads
+AUTO_BACKEND = "Automático"
+
+def app_data_path(name):
+    # Dados locais do aplicativo ficam em ~/.nota_fiscal, fora do diretório
+    # de trabalho do servidor
+    return os.path.join(os.path.expanduser("~"), ".nota_fiscal", name)
+
+@st.cache_resource
+def get_extraction_cache():
+    # Um único cache por processo, preservado entre as reexecuções do Streamlit.
+    # O nível em disco (NOTA_FISCAL_CACHE_DIR; vazio desativa) é compartilhado
+    # pelos processos que usam o mesmo diretório.
+    return ExtractionCache(
+        max_memory_bytes=int(os.environ.get("NOTA_FISCAL_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+        disk_dir=os.environ.get("NOTA_FISCAL_CACHE_DIR", app_data_path("nfce_cache")) or None,
+        max_disk_bytes=int(os.environ.get("NOTA_FISCAL_CACHE_DISK_MB", "512")) * 1024 * 1024,
+    )
+
+@st.cache_resource
+def get_document_index():
+    # Índice de NFC-e já processadas, compartilhado entre as sessões.
+    # Definir NOTA_FISCAL_INDEX_PATH o mantém entre reinícios do servidor.
+    return DocumentIndex(os.environ.get("NOTA_FISCAL_INDEX_PATH") or None)
+
+@st.cache_resource
+def get_quarantine():
+    # Arquivos que estouraram os limites do modo isolado, compartilhados entre
+    # as sessões; NOTA_FISCAL_QUARANTINE_PATH mantém o registro entre reinícios
+    return Quarantine(os.environ.get("NOTA_FISCAL_QUARANTINE_PATH") or None)
+
+def get_worker_limits():
+    return WorkerLimits(
+        timeout=float(os.environ.get("NOTA_FISCAL_FILE_TIMEOUT", "60")),
+        memory_mb=int(os.environ.get("NOTA_FISCAL_WORKER_MEMORY_MB", "1024")),
+        max_tasks=int(os.environ.get("NOTA_FISCAL_WORKER_MAX_TASKS", "50")),
+    )
+
+@st.cache_resource
+def get_receipt_store():
+    # Histórico local das NFC-e extraídas; NOTA_FISCAL_DB_PATH vazio desativa
+    path = os.environ.get("NOTA_FISCAL_DB_PATH", app_data_path("nfce_historico.sqlite3"))
+    if not path:
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return ReceiptStore(path)
+
+def save_to_store(store, session, keys, profiler=NULL_PROFILER):
+    # Gravar no histórico os arquivos extraídos nesta atualização, em lotes
+    positions = {key: idx for idx, key in enumerate(session.order)}
+    with profiler.stage("store_save", files=len(keys)) as event:
+        event["saved"] = store.save_documents(
+            (session.entries[key].digest, session.entries[key].name, session.entries[key].header, session.table.file_frame(positions[key]))
+            for key in keys
+        )
+
+@st.cache_resource
+def get_backend_calibration():
+    # Resultado da calibração dos leitores de PDF, compartilhado entre as sessões
+    return {}
+
+def release_archive_members(session, uploaded_files):
+    # Os bytes de um documento descompactado só são necessários até o
+    # resultado dele estar no lote (ou ele ser reconhecido como duplicado)
+    for key, uploaded_file in zip(upload_keys(uploaded_files), uploaded_files):
+        entry = session.entries.get(key)
+        if isinstance(uploaded_file, ArchiveMember) and entry is not None and not entry.pending:
+            uploaded_file.release()
+
+def update_extraction(session, uploaded_files, cache, max_workers, document_index, skip_known, backend_choice, limits=None, profiler=NULL_PROFILER):
+    # Extração em segundo plano: iniciar um job para os arquivos novos e, a
+    # cada reexecução, incorporar à sessão os resultados já prontos.
+    # Retorna o job em andamento (ou None) e as chaves recém-extraídas.
+    job = st.session_state.get("extraction_job")
+    changed = upload_keys(uploaded_files) != session.target
+    if changed:
+        st.session_state["extraction_cancelled"] = False
+    if job is not None and (changed or job.cancelled):
+        job.cancel()
+        job = st.session_state["extraction_job"] = None
+
+    if job is None and (changed or (session.pending_count and not st.session_state.get("extraction_cancelled"))):
+        _, pending = session.start(uploaded_files, document_index, skip_known)
+        if pending:
+            # As medidas exibidas passam a ser as deste lote
+            profiler.clear()
+            # Na opção "Automático", a calibração é feita pelo próprio job
+            auto = backend_choice == AUTO_BACKEND
+            job = st.session_state["extraction_job"] = ExtractionJob(
+                pending,
+                cache,
+                max_workers,
+                profiler=profiler,
+                backend=None if auto else backend_choice,
+                limits=limits,
+                quarantine=get_quarantine(),
+                calibration=get_backend_calibration() if auto else None,
+            ).start()
+
+    extracted = []
+    if job is not None:
+        extracted = session.complete(job.poll())
+        # PDFs que não são DANFE de NFC-e, rejeitados pela triagem da primeira página
+        rejected, saved_seconds = job.pop_screening()
+        screening = st.session_state.setdefault("screening", {"rejected": 0, "saved_seconds": 0.0})
+        screening["rejected"] += rejected
+        screening["saved_seconds"] += saved_seconds
+        if job.error is not None:
+            st.error(f"Erro na extração: {job.error}")
+        if job.done:
+            job = st.session_state["extraction_job"] = None
+    release_archive_members(session, uploaded_files)
+    return job, extracted
+
+def show_progress(session, job):
+    done = len(session.target) - session.pending_count
+    total = len(session.target)
+    st.progress(done / total if total else 1.0, text=f"Extraindo: {done} de {total} arquivo(s) prontos")
+    if st.sidebar.button("Cancelar extração"):
+        job.cancel()
+        st.session_state["extraction_cancelled"] = True
+        st.rerun()
+
+def duplicate_label(session, entry):
+    if entry.duplicate_of is None:
+        return None
+    if entry.seen_before:
+        return f"{entry.duplicate_of} (sessão anterior)"
+    return session.entries[entry.duplicate_of].name
+
+def paged_dataframe(frame, key, default_page_size=50):
+    # Exibir só uma página da tabela: o volume enviado ao navegador não cresce
+    # com o número de linhas
+    page_sizes = [20, 50, 100, 500]
+    col_size, col_page, col_info = st.columns([1, 1, 2])
+    page_size = col_size.selectbox("Linhas por página", page_sizes, index=page_sizes.index(default_page_size), key=f"{key}_page_size")
+    page_count = max(1, -(-len(frame) // page_size))
+    # Sem max_value: ele faz parte da identidade do widget, e a página voltaria
+    # para a primeira sempre que o número de linhas mudasse
+    page = min(col_page.number_input("Página", min_value=1, value=1, key=f"{key}_page"), page_count)
+    start = (page - 1) * page_size
+    col_info.caption(f"Página {page} de {page_count} — linhas {min(start + 1, len(frame))}–{min(start + page_size, len(frame))} de {len(frame)}")
+    st.dataframe(frame.iloc[start:start + page_size], use_container_width=True, hide_index=True)
+
+def show_history(store):
+    # Consultas ao histórico acumulado de NFC-e, por período e por emitente
+    with st.expander("🗄️ `Histórico de NFC-e`"):
+        first, last = store.date_range()
+        if first is None:
+            st.write("Nenhuma NFC-e com data de emissão no histórico.")
+            return
+        col_period, col_store = st.columns(2)
+        period = col_period.date_input("Período", value=(pd.Timestamp(first).date(), pd.Timestamp(last).date()), key="historico_periodo")
+        cnpj = col_store.selectbox("CNPJ do emitente", ["Todos"] + store.stores(), key="historico_cnpj")
+        start, end = (period + (period[0],))[:2] if isinstance(period, tuple) and period else (None, None)
+        cnpj = None if cnpj == "Todos" else cnpj
+
+        history = store.statistics(start=start, end=end, cnpj=cnpj)
+        st.write(f"NFC-e no período: {history.file_count} — {history.item_count} itens — R${history.total_sum:.2f}")
+        monthly = store.monthly_totals(start=start, end=end, cnpj=cnpj)
+        st.plotly_chart(monthly_bar(monthly), use_container_width=True)
+        st.write("Produtos com maior gasto no período")
+        st.dataframe(history.top_products, use_container_width=True, hide_index=True)
+
+def show_diagnostics(profiler):
+    # Expander com o tempo de cada etapa do pipeline e exportação das medidas
+    with st.expander("🩺 `Diagnóstico de desempenho`"):
+        st.dataframe(profiler.summary(), use_container_width=True, hide_index=True)
+        per_file = [{"Arquivo": name, **{stage: round(ms, 2) for stage, ms in stages.items()}} for name, stages in profiler.by_file().items()]
+        if per_file:
+            st.write("Tempo por arquivo (ms)")
+            st.dataframe(per_file, use_container_width=True, hide_index=True)
+        st.download_button("Baixar medidas (JSON)", data=profiler.to_json(), file_name="diagnostico.json", mime="application/json")
+        st.download_button("Baixar trace (Chrome/Perfetto)", data=profiler.to_chrome_trace(), file_name="diagnostico.trace.json", mime="application/json")
 
 def main():
     st.sidebar.success("Extrair dados de PDF e visualizar na interface WEB, de NFC-e DANFE do site: https://notapotiguar.set.rn.gov.br/hotsite/#/login")
@@ -79,64 +204,193 @@ def main():
     col1, col2 = st.columns(2)
     
     with col1:
-        uploaded_files = st.sidebar.file_uploader("Carregar PDF(s)", type="pdf", accept_multiple_files=True)
+        uploaded_files = st.sidebar.file_uploader("Carregar PDF(s) ou XML(s) de NFC-e", type=["pdf", "xml", "zip", "gz", "tgz"], accept_multiple_files=True, help="Arquivos ZIP, tar.gz ou gzip são descompactados em memória, sem passar pelo disco.")
+        max_workers = st.sidebar.number_input("Processos paralelos", min_value=1, max_value=64, value=min(default_workers(), 64))
+        backend_choice = st.sidebar.selectbox("Leitor de PDF", [AUTO_BACKEND] + list(PDF_BACKENDS), help="Automático: o leitor mais rápido cujas linhas conferem com as do PyPDF2 em uma amostra. Notas que não conferem com o rodapé são relidas com o PyPDF2.")
+        isolated = st.sidebar.toggle("Extração isolada", value=True, help="Cada arquivo tem um tempo limite e os processos de extração, um teto de memória; arquivos que passam desses limites vão para a quarentena e não são extraídos de novo.")
+        skip_known = st.sidebar.toggle("Ignorar NFC-e já processadas em sessões anteriores", value=False)
+        diagnostics = st.sidebar.toggle("Diagnóstico de desempenho", value=False)
+        # O Profiler fica na sessão, ao lado do job: a extração em segundo plano
+        # continua registrando nele as etapas durante as reexecuções seguintes
+        profiler = st.session_state.get("profiler", NULL_PROFILER)
+        if profiler.enabled != diagnostics:
+            profiler = st.session_state["profiler"] = Profiler() if diagnostics else NULL_PROFILER
+
+        # Resultados por arquivo guardados na sessão: a cada reexecução só os
+        # arquivos novos são extraídos e a tabela é atualizada pela diferença
+        # Acima de NOTA_FISCAL_TABLE_MEMORY_MB a tabela consolidada é despejada em disco
+        session = st.session_state.get("batch_session")
+        if session is None:
+            memory_limit = os.environ.get("NOTA_FISCAL_TABLE_MEMORY_MB")
+            session = st.session_state["batch_session"] = BatchSession(
+                memory_limit=int(memory_limit) * 1024 * 1024 if memory_limit else None,
+                spill_dir=os.environ.get("NOTA_FISCAL_SPILL_DIR") or None,
+            )
+
+        # Os arquivos compactados entram no lote como os documentos que contêm;
+        # NOTA_FISCAL_ARCHIVE_MAX_MB limita os bytes descompactados de cada um
+        archive_limit = os.environ.get("NOTA_FISCAL_ARCHIVE_MAX_MB")
+        uploaded_files, archive_errors = expand_uploads(
+            uploaded_files or [],
+            st.session_state.setdefault("archive_members", {}),
+            int(archive_limit) * 1024 * 1024 if archive_limit else MAX_UNCOMPRESSED_BYTES,
+        )
+        for name, error in archive_errors:
+            st.error(f"Erro ao descompactar '{name}': {error}")
 
         if uploaded_files:
-            all_data = []
-            total_values = []
-
-            # Expander para cada PDF
-            for idx, uploaded_file in enumerate(uploaded_files):
-                data, total_value = extract_data_from_pdf(uploaded_file)
-                df = pd.DataFrame(data, columns=["Item", "Descrição", "Qtde.", "Unid.", "Vl. unid.", "Vl. total"])
-                all_data.append(df)  # Adicionar DataFrame à lista
-                total_values.append(total_value)
-
-                with st.expander(f"`{idx+1}ª NFC-e DANFE R$ {total_value:.2f}`"):
-                    st.data_editor(df, use_container_width=True, num_rows="fixed", hide_index=True, key={idx+1})  # Remover [:-1] para incluir a última linha ("Total")
-                    st.success(f"Total: {total_value:.2f}")
+            cache = get_extraction_cache()
+
+            with profiler.stage("extraction", files=len(uploaded_files)) as event:
+                job, extracted_keys = update_extraction(session, uploaded_files, cache, int(max_workers), get_document_index(), skip_known, backend_choice, get_worker_limits() if isolated else None, profiler)
+                sync_report = session.report
+                event["added"] = sync_report.added
+                event["removed"] = sync_report.removed
+                event["rows"] = len(session.table.frame)
+            if job is not None:
+                show_progress(session, job)
+            elif session.pending_count:
+                st.warning(f"Extração cancelada: {session.pending_count} arquivo(s) não processado(s)")
+                if st.sidebar.button("Retomar extração"):
+                    st.session_state["extraction_cancelled"] = False
+                    st.rerun()
+            for name, error in session.errors():
+                st.error(f"Erro ao processar '{name}': {error}")
+
+            store = get_receipt_store()
+            if store is not None and extracted_keys:
+                save_to_store(store, session, extracted_keys, profiler)
+
+            table = session.table
+            total_values = session.file_totals
+
+            # Resumo paginado de cada PDF; os itens só são enviados ao navegador
+            # para a NFC-e selecionada, qualquer que seja o tamanho do lote
+            entries = [session.entries[key] for key in session.order]
+            headers = [entry.header or {} for entry in entries]
+            summary = pd.DataFrame({
+                "NFC-e": [f"{idx+1}ª" for idx in range(table.file_count)],
+                "Arquivo": table.file_names,
+                "Número": pd.array([header.get("number") for header in headers], dtype="Int64"),
+                "Série": pd.array([header.get("series") for header in headers], dtype="Int64"),
+                "Chave de acesso": [header.get("access_key") for header in headers],
+                "Itens": np.diff(table.offsets),
+                "Valor Total (R$)": total_values,
+                "Duplicada de": [duplicate_label(session, entry) for entry in entries],
+            })
+            paged_dataframe(summary, key="resumo_pdfs", default_page_size=20)
+
+            # A NFC-e é escolhida pelo número do resumo: nenhuma lista de rótulos
+            # é enviada ao navegador, e a escolha não muda quando outros
+            # arquivos terminam de ser extraídos
+            if table.file_count:
+                position = st.number_input("NFC-e DANFE (nº do resumo)", min_value=1, value=1, step=1, key="nfce_escolhida")
+                idx = min(position, table.file_count) - 1
+                st.caption(f"{idx+1}ª NFC-e DANFE de {table.file_count}: R$ {total_values[idx]:.2f} ({table.file_names[idx]})")
+                df = table.file_frame(idx)
+                st.data_editor(df, use_container_width=True, num_rows="fixed", hide_index=True, key=f"nfce_{idx+1}")
+                st.success(f"Total: {total_values[idx]:.2f}")
+
+            cache_stats = cache.stats()
+            st.sidebar.caption(f"Cache de extração: {cache_stats['hits']} acertos ({cache_stats['disk_hits']} do cache compartilhado), {cache_stats['misses']} falhas ({cache_stats['hit_rate']:.0%})")
+            st.sidebar.caption(f"Sessão: {sync_report.added} novo(s), {sync_report.removed} removido(s), {sync_report.reused} reaproveitado(s)")
+            calibration = get_backend_calibration().get("result")
+            if backend_choice == AUTO_BACKEND and calibration is not None:
+                timings = ", ".join(f"{name} {seconds:.2f}s{'' if calibration.matches[name] else ' (divergente)'}" for name, seconds in calibration.seconds.items())
+                st.sidebar.caption(f"Leitor de PDF: {calibration.backend} ({timings})")
+            st.sidebar.caption(f"Tabela consolidada: {table.item_count} itens, {'em disco' if table.spilled else f'{table.memory_usage() / 1024 / 1024:.1f} MB em memória'}")
+            screening = st.session_state.get("screening")
+            if screening and screening["rejected"]:
+                st.sidebar.caption(f"Triagem: {screening['rejected']} PDF(s) que não são DANFE de NFC-e rejeitado(s) pela primeira página, ~{screening['saved_seconds']:.2f}s poupados")
+            if len(get_quarantine()):
+                st.sidebar.caption(f"Quarentena: {len(get_quarantine())} arquivo(s) que excederam os limites de extração")
+            duplicates = session.duplicates()
+            if duplicates:
+                st.warning(f"{duplicates} NFC-e duplicada(s) fora dos totais ({sync_report.skipped} sem nova extração nesta atualização)")
+        else:
+            job = st.session_state.pop("extraction_job", None)
+            if job is not None:
+                job.cancel()
+            job = None
+            session.clear()
+            st.session_state.pop("screening", None)
     
     # Expander com todos os PDFs juntos
     with col2:
         if uploaded_files:
 
-            total_sum = sum(total_values)
+            with profiler.stage("statistics"):
+                # Duplicatas e arquivos com erro ficam fora das estatísticas por arquivo
+                counted = session.counted_positions()
+                if store is not None:
+                    # Estatísticas do lote consultadas no histórico, sem recalcular a partir dos PDFs
+                    entries = [session.entries[session.order[idx]] for idx in counted]
+                    statistics = store.statistics(
+                        digests=[entry.digest for entry in entries],
+                        access_keys=[(entry.header or {}).get("access_key") for entry in entries],
+                        labels=[f"PDF {idx+1}" for idx in counted],
+                    )
+                else:
+                    statistics = get_statistics(table, files=counted)
+            total_sum = session.total_sum
             st.info(f"🧮 Valor Total dos Produtos em todos os PDFs: {total_sum:.2f}")
 
-            # Concatenar todos os DataFrames em um único DataFrame
-            df_all = pd.concat(all_data, ignore_index=True)
+            # Tabela consolidada, já montada uma única vez para todo o lote,
+            # exibida somente leitura e paginada no servidor
+            df_all = table.frame
 
-            st.data_editor(df_all, use_container_width=True, num_rows="fixed", hide_index=True)  # Remover [:-1] para incluir a última linha ("Total")
+            paged_dataframe(df_all, key="todos_pdfs")
 
             # Expander com estatísticas e gráficos
             with st.expander("📊 `Estatísticas e Gráficos`"):
-                st.write(f"Total de PDFs carregados: {len(uploaded_files)}")
+                st.write(f"Total de PDFs carregados: {statistics.file_count}")
                 st.write(f"Valor Total dos Produtos em todos os PDFs: R${total_sum:.2f}")
-                st.write(f"Número Total de Itens em todos os PDFs: {df_all.shape[0]}")  # Usar a contagem de linhas do DataFrame consolidado
-                st.write(f"Média dos Valores Totais: R${total_sum/len(total_values):.2f}")
-                st.write(f"Valor Mínimo Total: R${min(total_values):.2f}")
-                st.write(f"Valor Máximo Total: R${max(total_values):.2f}")
-
-                df_values = pd.DataFrame({"PDF": [f"PDF {i+1}" for i in range(len(total_values))], "Valor Total (R$)": total_values})
-                fig1 = px.bar(df_values, x="PDF", y="Valor Total (R$)", title="Valor Total de cada PDF")
-                st.plotly_chart(fig1, use_container_width=True)
-
-                contributions = [(val / total_sum) * 100 for val in total_values]
-                df_contributions = pd.DataFrame({"PDF": [f"PDF {i+1}" for i in range(len(total_values))], "Contribuição (%)": contributions})
-                fig2 = px.pie(df_contributions, values="Contribuição (%)", names="PDF", title="Contribuição Percentual de cada PDF para o Valor Total")
-                st.plotly_chart(fig2, use_container_width=True)
-                
-                
-                
+                st.write(f"Número Total de Itens em todos os PDFs: {statistics.item_count}")
+                st.write(f"Média dos Valores Totais: R${statistics.mean_total:.2f}")
+                st.write(f"Valor Mínimo Total: R${statistics.min_total:.2f}")
+                st.write(f"Valor Máximo Total: R${statistics.max_total:.2f}")
+
+                with profiler.stage("charts"):
+                    # Figuras memoizadas pelos dados; em lotes grandes os PDFs
+                    # são agrupados em faixas e em "Outros"
+                    st.plotly_chart(per_file_bar(statistics.per_file), use_container_width=True)
+                    st.plotly_chart(contribution_pie(statistics.per_file), use_container_width=True)
+                    st.plotly_chart(top_products_bar(statistics.top_products), use_container_width=True)
+
+                st.write("Preço unitário por produto")
+                paged_dataframe(statistics.unit_prices, key="precos_unitarios", default_page_size=20)
+
+                st.write("Quantidade por unidade")
+                st.dataframe(statistics.quantity_by_unit, use_container_width=True, hide_index=True)
+
+            if store is not None:
+                show_history(store)
+
+            excel_streaming = st.sidebar.toggle("Excel consolidado (streaming)", value=True, help="Uma planilha com todos os itens e um índice, gravada com uso de memória constante. Desative para uma planilha por PDF.")
             excel_file = st.sidebar.button("Salvar como Excel")
             if excel_file:
                 file_name = "dados_extraidos.xlsx"
-                with pd.ExcelWriter(file_name, engine='xlsxwriter') as writer:
-                    for idx, df_data in enumerate(all_data):
-                        total_value = total_values[idx]
-                        sheet_name = f"Sheet{idx+1}_Total_{total_value:.2f}"
-                        df_data.to_excel(writer, sheet_name=sheet_name, index=False)
-                st.success(f"Arquivo Excel '{file_name}' gerado com sucesso!")
+                with profiler.stage("excel_export") as event:
+                    excel_buffer, report = export_excel(table, streaming=excel_streaming, trace_memory=profiler.enabled)
+                    event["rows"] = report.rows
+                    event["bytes"] = report.size_bytes
+                    if profiler.enabled:
+                        event["peak_traced_mb"] = report.peak_traced_mb
+                st.sidebar.download_button(f"Baixar {file_name}", data=excel_buffer.getvalue(), file_name=file_name, mime=EXCEL_MIME)
+                message = f"Arquivo Excel '{file_name}' gerado com sucesso! {report.rows} itens em {report.sheets} planilha(s), {report.seconds:.2f}s"
+                if profiler.enabled:
+                    # Pico medido com o tracemalloc, só durante o diagnóstico
+                    message += f", pico de memória da exportação {report.peak_traced_mb:.1f} MB"
+                st.success(message)
+
+            if profiler.enabled:
+                show_diagnostics(profiler)
+
+    # Com a extração em andamento, reexecutar periodicamente para exibir os
+    # resultados parciais e o progresso
+    if job is not None:
+        time.sleep(PROGRESS_POLL_SECONDS)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,187 @@
+import gzip
+import io
+import os
+import tarfile
+import zipfile
+from dataclasses import dataclass, field
+
+
+# Limite de bytes descompactados por arquivo compactado, contra "zip bombs":
+# o tamanho declarado de cada membro é conferido antes da leitura e os bytes
+# efetivamente descompactados, durante a leitura
+MAX_UNCOMPRESSED_BYTES = 1024 * 1024 * 1024
+READ_CHUNK_BYTES = 1024 * 1024
+
+# ".gz" cobre tanto o tar.gz quanto um único PDF ou XML compactado com gzip
+ARCHIVE_EXTENSIONS = (".zip", ".tgz", ".gz")
+MEMBER_EXTENSIONS = (".pdf", ".xml")
+
+ZIP_SIGNATURES = (b"PK\x03\x04", b"PK\x05\x06")
+GZIP_SIGNATURE = b"\x1f\x8b"
+# Bytes descompactados conferidos para distinguir um documento de um tar
+DOCUMENT_HEAD_BYTES = 64
+
+
+def is_archive(name):
+    return name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _wanted(name):
+    # PDFs e XMLs, ignorando os metadados que o macOS acrescenta aos ZIPs
+    base = os.path.basename(name)
+    return name.lower().endswith(MEMBER_EXTENSIONS) and not base.startswith("._") and "__MACOSX/" not in name
+
+
+class _Budget:
+    # Bytes descompactados ainda permitidos no arquivo compactado
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+
+    def check(self, name, size):
+        if self.used + size > self.limit:
+            raise ValueError(f"Arquivo compactado excede o limite de {self.limit / 1024 / 1024:.0f} MB descompactados (em '{name}')")
+
+    def read(self, name, member):
+        chunks = []
+        while True:
+            chunk = member.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            self.check(name, len(chunk))
+            self.used += len(chunk)
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+
+def _is_document(head):
+    # Início de um PDF ou de um XML (após um BOM opcional), e não de um tar
+    return head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith((b"%PDF", b"<"))
+
+
+def _document_name(source, head):
+    # Nome de um único documento compactado com gzip: o do arquivo, sem o
+    # ".gz" e com a extensão do conteúdo se faltar ("notas.gz" -> "notas.pdf")
+    name = os.path.basename(os.fspath(source) if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "") or "documento")
+    if name.lower().endswith(".gz"):
+        name = name[:-3]
+    if not name.lower().endswith(MEMBER_EXTENSIONS):
+        name += ".pdf" if head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"%PDF") else ".xml"
+    return name
+
+
+def _open_source(source):
+    # Caminho, bytes ou objeto de arquivo (como o UploadedFile do Streamlit)
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def iter_archive(source, max_bytes=MAX_UNCOMPRESSED_BYTES):
+    # Gerador de (nome do membro, bytes) dos PDFs e XMLs de um ZIP ou tar.gz,
+    # na ordem do arquivo, ou do único documento de um PDF ou XML compactado
+    # com gzip. Cada membro é descompactado em memória só quando pedido, sem
+    # passar pelo disco; ValueError acima de `max_bytes`.
+    budget = _Budget(max_bytes)
+    stream = _open_source(source)
+    try:
+        signature = stream.read(4)
+        stream.seek(0)
+        if signature.startswith(ZIP_SIGNATURES):
+            with zipfile.ZipFile(stream) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not _wanted(info.filename):
+                        continue
+                    budget.check(info.filename, info.file_size)
+                    with archive.open(info) as member:
+                        yield info.filename, budget.read(info.filename, member)
+        elif signature.startswith(GZIP_SIGNATURE):
+            with gzip.GzipFile(fileobj=stream) as document:
+                head = document.read(DOCUMENT_HEAD_BYTES)
+            stream.seek(0)
+            if _is_document(head):
+                name = _document_name(source, head)
+                with gzip.GzipFile(fileobj=stream) as document:
+                    yield name, budget.read(name, document)
+                return
+            # Modo de fluxo ("r|gz"): os membros são lidos em sequência, sem índice
+            with tarfile.open(fileobj=stream, mode="r|gz") as archive:
+                for info in archive:
+                    if not info.isfile() or not _wanted(info.name):
+                        continue
+                    budget.check(info.name, info.size)
+                    yield info.name, budget.read(info.name, archive.extractfile(info))
+        else:
+            raise ValueError("Formato de arquivo compactado não suportado (use ZIP, tar.gz ou gzip)")
+    finally:
+        if isinstance(source, (str, os.PathLike)):
+            stream.close()
+
+
+@dataclass(eq=False)
+class ArchiveMember:
+    # Documento de um arquivo compactado, com a interface do UploadedFile usada
+    # pelo lote (name, file_id, size, getvalue, getbuffer). Os bytes são
+    # descartados por release() assim que o resultado do documento está no
+    # lote: o membro continua identificando o documento, sem ocupar memória.
+    name: str
+    file_id: str
+    data: bytes
+    size: int = field(init=False)
+
+    def __post_init__(self):
+        self.size = len(self.data)
+
+    def _bytes(self):
+        if self.data is None:
+            raise ValueError(f"Os bytes de '{self.name}' já foram descartados")
+        return self.data
+
+    def getvalue(self):
+        return self._bytes()
+
+    def getbuffer(self):
+        return memoryview(self._bytes())
+
+    def release(self):
+        self.data = None
+
+
+def expand_uploads(uploaded_files, expanded, max_bytes=MAX_UNCOMPRESSED_BYTES):
+    # Substituir cada arquivo compactado enviado pelos documentos que ele
+    # contém, na ordem do arquivo. `expanded` guarda, entre as reexecuções, os
+    # membros já descompactados de cada upload (e é podado dos que saíram).
+    # Retorna (arquivos, erros [(nome do arquivo compactado, mensagem)]).
+    # Importado aqui para que a linha de comando não dependa do pandas
+    from session import file_identity
+
+    files = []
+    errors = []
+    current = set()
+    for uploaded_file in uploaded_files:
+        if not is_archive(uploaded_file.name):
+            files.append(uploaded_file)
+            continue
+        key = file_identity(uploaded_file)
+        current.add(key)
+        if key not in expanded:
+            try:
+                members = [
+                    ArchiveMember(name=f"{uploaded_file.name}/{name}", file_id=f"{key}/{position}:{name}", data=data)
+                    for position, (name, data) in enumerate(iter_archive(uploaded_file, max_bytes))
+                ]
+                expanded[key] = (members, None)
+            except (ValueError, OSError, EOFError, RuntimeError, zipfile.BadZipFile, tarfile.TarError) as exc:
+                expanded[key] = ([], f"{type(exc).__name__}: {exc}")
+        members, error = expanded[key]
+        files.extend(members)
+        if error is not None:
+            errors.append((uploaded_file.name, error))
+
+    for key in [key for key in expanded if key not in current]:
+        del expanded[key]
+    return files, errors
@@ -0,0 +1,78 @@
+import threading
+
+from PyPDF2 import PdfReader
+
+try:
+    import pypdf
+except ImportError:  # dependência opcional
+    pypdf = None
+
+try:
+    import pypdfium2
+except ImportError:  # dependência opcional
+    pypdfium2 = None
+
+# Leitor de referência: os demais só são usados quando produzem as mesmas linhas
+REFERENCE_BACKEND = "pypdf2"
+
+
+class _Page:
+    __slots__ = ("document", "index")
+
+    def __init__(self, document, index):
+        self.document = document
+        self.index = index
+
+    def extract_text(self):
+        return self.document.page_text(self.index)
+
+
+class _PdfiumDocument:
+    # Adaptador com a mesma interface usada do PdfReader (pages[i].extract_text())
+    # O PDFium não pode ser usado por duas threads ao mesmo tempo
+    _lock = threading.Lock()
+
+    def __init__(self, stream):
+        with self._lock:
+            self._document = pypdfium2.PdfDocument(stream)
+        self.pages = [_Page(self, index) for index in range(len(self._document))]
+
+    def page_text(self, index):
+        with self._lock:
+            page = self._document[index]
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+        # O PDFium separa as linhas com "\r\n"; o parser espera "\n"
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _open_pypdf2(stream):
+    return PdfReader(stream)
+
+
+def _open_pypdf(stream):
+    return pypdf.PdfReader(stream)
+
+
+def _open_pdfium(stream):
+    return _PdfiumDocument(stream)
+
+
+# Leitores disponíveis: nome -> função que abre o PDF e devolve um objeto com
+# `pages`, cujas páginas têm `extract_text()`
+PDF_BACKENDS = {REFERENCE_BACKEND: _open_pypdf2}
+if pypdf is not None:
+    PDF_BACKENDS["pypdf"] = _open_pypdf
+if pypdfium2 is not None:
+    PDF_BACKENDS["pdfium"] = _open_pdfium
+
+
+def get_backend(name=None):
+    try:
+        return PDF_BACKENDS[name or REFERENCE_BACKEND]
+    except KeyError:
+        raise ValueError(f"Leitor de PDF desconhecido ou não instalado: {name!r}. Opções: {', '.join(PDF_BACKENDS)}") from None
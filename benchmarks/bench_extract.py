@@ -0,0 +1,176 @@
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from PyPDF2 import PdfReader
+
+from benchmarks.corpus import make_danfe
+from backends import PDF_BACKENDS, REFERENCE_BACKEND
+from extractor import DEFAULT_PARSER, PAGE_PARSERS, PARSER_VERSION, calibrate_backend, extract_data_from_pdf
+from isolation import WorkerLimits, iter_extract_isolated
+from parallel import iter_extract
+from profiling import peak_rss_mb
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+def bench_pages(corpus, parser, repeat):
+    # Tempo por página: extract_text() e a leitura das linhas medidos separadamente
+    extract_samples = []
+    parse_samples = []
+    parse_page = PAGE_PARSERS[parser]
+    for _ in range(repeat):
+        for pdf_bytes in corpus:
+            for page in PdfReader(io.BytesIO(pdf_bytes)).pages:
+                started = time.perf_counter()
+                text = page.extract_text()
+                extracted = time.perf_counter()
+                parse_page(text)
+                extract_samples.append(extracted - started)
+                parse_samples.append(time.perf_counter() - extracted)
+    return {"extract_text_s": summarize(extract_samples), "parse_s": summarize(parse_samples)}
+
+
+def bench_files(corpus, parser, repeat, backend=None):
+    samples = []
+    rows = 0
+    for _ in range(repeat):
+        for pdf_bytes in corpus:
+            started = time.perf_counter()
+            data, _ = extract_data_from_pdf(pdf_bytes, parser, backend=backend)
+            samples.append(time.perf_counter() - started)
+            rows += len(data)
+
+    # O pico de memória é medido numa passagem separada, pois o tracemalloc
+    # deixa a execução bem mais lenta e distorceria os tempos
+    peak = 0
+    for pdf_bytes in corpus:
+        tracemalloc.start()
+        extract_data_from_pdf(pdf_bytes, parser, backend=backend)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    elapsed = sum(samples)
+    return {
+        "file_s": summarize(samples),
+        "files_per_s": len(samples) / elapsed,
+        "items_per_s": rows / elapsed,
+        "peak_traced_mb": peak / 1024 / 1024,
+    }
+
+
+def bench_batch(corpus, parser, workers, backend=None, isolated=False):
+    # Mesmo caminho do aplicativo e da linha de comando: iter_extract ou, no
+    # modo isolado, iter_extract_isolated (inclui a criação dos processos)
+    files = [(f"danfe_{index}.pdf", pdf_bytes) for index, pdf_bytes in enumerate(corpus)]
+    started = time.perf_counter()
+    if isolated:
+        results = list(iter_extract_isolated(files, workers, parser=parser, backend=backend, limits=WorkerLimits()))
+    else:
+        results = list(iter_extract(files, max_workers=workers, parser=parser, backend=backend))
+    elapsed = time.perf_counter() - started
+    rows = sum(len(result.data or []) for result in results)
+    return {
+        "workers": workers,
+        "isolated": isolated,
+        "batch_s": elapsed,
+        "files_per_s": len(files) / elapsed,
+        "items_per_s": rows / elapsed,
+        "errors": sum(result.error is not None for result in results),
+    }
+
+
+def check_parsers_agree(corpus):
+    # Todos os motores devem produzir exatamente as mesmas linhas
+    reference = [extract_data_from_pdf(pdf_bytes, "legacy") for pdf_bytes in corpus]
+    return {
+        parser: all(extract_data_from_pdf(pdf_bytes, parser) == expected for pdf_bytes, expected in zip(corpus, reference))
+        for parser in PAGE_PARSERS
+    }
+
+
+def run(args):
+    corpus = [make_danfe(args.items, args.pages, args.description_words, seed) for seed in range(args.files)]
+    page_count = sum(len(PdfReader(io.BytesIO(pdf_bytes)).pages) for pdf_bytes in corpus)
+    parsers = args.parser or [DEFAULT_PARSER]
+
+    report = {
+        "revision": git_revision(),
+        "parser_version": PARSER_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus": {
+            "files": args.files,
+            "items_per_file": args.items,
+            "pages_per_file": args.pages,
+            "description_words": args.description_words,
+            "total_pages": page_count,
+            "total_bytes": sum(len(pdf_bytes) for pdf_bytes in corpus),
+        },
+        "parsers_agree": check_parsers_agree(corpus),
+        "backend": args.backend,
+        "results": {},
+    }
+    if args.calibrate:
+        calibration = calibrate_backend(corpus, parsers[0])
+        report["backend_calibration"] = {"selected": calibration.backend, "seconds": calibration.seconds, "matches": calibration.matches}
+    for parser in parsers:
+        report["results"][parser] = {
+            "per_page": bench_pages(corpus, parser, args.repeat),
+            "per_file": bench_files(corpus, parser, args.repeat, args.backend),
+            "batch": [bench_batch(corpus, parser, workers, args.backend, isolated) for workers in args.workers for isolated in (False, True)],
+        }
+    # Pico do processo inteiro (corpus, todas as medições e os workers em thread)
+    report["process_peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Medir o desempenho de extract_data_from_pdf em um corpus sintético de NFC-e DANFE.")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--items", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--description-words", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=1, help="repetições das medidas por página e por arquivo")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}), help="tamanhos de pool para a medida em lote")
+    parser.add_argument("--parser", choices=list(PAGE_PARSERS), action="append", help="motor(es) a medir (padrão: o motor padrão)")
+    parser.add_argument("--backend", choices=list(PDF_BACKENDS), default=REFERENCE_BACKEND, help="leitor de PDF usado nas medidas por arquivo e em lote")
+    parser.add_argument("--calibrate", action="store_true", help="comparar também todos os leitores de PDF instalados")
+    parser.add_argument("-o", "--output", help="arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import argparse
+import json
+import sys
+
+# Métricas comparadas: caminho dentro do relatório e se valores maiores são melhores
+METRICS = [
+    (("per_file", "file_s", "median"), False),
+    (("per_page", "extract_text_s", "median"), False),
+    (("per_page", "parse_s", "median"), False),
+    (("per_file", "items_per_s"), True),
+    (("per_file", "peak_traced_mb"), False),
+]
+
+
+def lookup(report, path):
+    for key in path:
+        report = report[key]
+    return report
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    for parser, results in current["results"].items():
+        if parser not in baseline["results"]:
+            continue
+        for path, higher_is_better in METRICS:
+            old = lookup(baseline["results"][parser], path)
+            new = lookup(results, path)
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            flag = "REGRESSÃO" if worse > threshold else ""
+            print(f"{parser:10s} {'.'.join(path):32s} {old:12.6g} -> {new:12.6g} ({change:+.1%}) {flag}")
+            if flag:
+                regressions.append((parser, path))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Comparar dois relatórios de bench_extract.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora relativa considerada regressão (padrão: 10%%)")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as baseline_file, open(args.current, encoding="utf-8") as current_file:
+        regressions = compare(json.load(baseline_file), json.load(current_file), args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import argparse
+import io
+import math
+import os
+import random
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from extractor import TABLE_HEADER
+
+PRODUCTS = [
+    "ARROZ TIPO 1", "FEIJAO CARIOCA", "LEITE INTEGRAL UHT", "CAFE TORRADO MOIDO", "ACUCAR CRISTAL",
+    "OLEO DE SOJA", "MACARRAO ESPAGUETE", "FARINHA DE MANDIOCA", "SABAO EM PO", "DETERGENTE NEUTRO",
+    "PAPEL HIGIENICO", "BISCOITO CREAM CRACKER", "MARGARINA COM SAL", "QUEIJO MUSSARELA", "PEITO DE FRANGO",
+    "CARNE MOIDA", "BANANA PRATA", "TOMATE", "CEBOLA", "BATATA INGLESA",
+]
+UNITS = [("UN", False), ("KG", True), ("PCT", False), ("L", False), ("CX", False)]
+EXTRA_WORDS = ["PREMIUM", "TRADICIONAL", "500G", "1KG", "2L", "ZERO", "INTEGRAL", "ORGANICO", "FAMILIA", "PROMO"]
+
+LINE_HEIGHT = 12
+TOP_MARGIN = 800
+BOTTOM_MARGIN = 50
+
+
+def format_brl(value, decimals=2):
+    # 1234.5 -> "1.234,50"
+    text = f"{value:,.{decimals}f}"
+    return text.replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def access_key(rng):
+    # Chave de acesso de 44 dígitos com dígito verificador (módulo 11)
+    digits = "24" + rng.choice(["2401", "2405", "2410"]) + "".join(str(rng.randint(0, 9)) for _ in range(14)) + "65" + "001"
+    digits += "".join(str(rng.randint(0, 9)) for _ in range(9)) + "1" + "".join(str(rng.randint(0, 9)) for _ in range(8))
+    weights = [2, 3, 4, 5, 6, 7, 8, 9]
+    total = sum(int(digit) * weights[index % 8] for index, digit in enumerate(reversed(digits)))
+    check = 11 - total % 11
+    return digits + str(0 if check >= 10 else check)
+
+
+def make_danfe(items=30, pages=1, description_words=3, seed=0, repeat_header=False):
+    # Gerar os bytes de um PDF com o layout de texto de uma NFC-e DANFE
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setFont("Helvetica", 8)
+    items_per_page = math.ceil(items / pages) if items else 0
+    position = [TOP_MARGIN]
+
+    def write(text):
+        if position[0] < BOTTOM_MARGIN:
+            new_page()
+        pdf.drawString(20, position[0], text)
+        position[0] -= LINE_HEIGHT
+
+    def new_page():
+        pdf.showPage()
+        pdf.setFont("Helvetica", 8)
+        position[0] = TOP_MARGIN
+        if repeat_header:
+            write(TABLE_HEADER)
+
+    write("SUPERMERCADO EXEMPLO LTDA")
+    write(f"CNPJ: {rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/0001-{rng.randint(10, 99)}")
+    write("AV. SENADOR SALGADO FILHO, 1000, LAGOA NOVA, NATAL, RN")
+    write("Documento Auxiliar da Nota Fiscal de Consumidor Eletrônica")
+    write(TABLE_HEADER)
+
+    total = 0.0
+    for number in range(1, items + 1):
+        if items_per_page and number > 1 and (number - 1) % items_per_page == 0:
+            new_page()
+        unit, fractional = rng.choice(UNITS)
+        quantity = round(rng.uniform(0.1, 3), 3) if fractional else rng.randint(1, 6)
+        unit_price = round(rng.uniform(0.5, 80), 2)
+        if rng.random() < 0.02:
+            unit_price = round(rng.uniform(1000, 3000), 2)
+        line_total = round(quantity * unit_price, 2)
+        total += line_total
+        words = [rng.choice(PRODUCTS)] + [rng.choice(EXTRA_WORDS) for _ in range(max(0, description_words - 2))]
+        description = " ".join(words)
+        quantity_text = format_brl(quantity, 3) if fractional else str(quantity)
+        write(f"{number:03d} {description} {quantity_text} {unit} {format_brl(unit_price)} {format_brl(line_total)}")
+
+    # Rodapé: totais, pagamento, chave de acesso, consumidor e protocolo
+    for _ in range(pages - pdf.getPageNumber()):
+        new_page()
+    write(f"Qtd. total de itens {items}")
+    write(f"Valor total R$ {format_brl(total)}")
+    write(f"Valor a pagar R$ {format_brl(total)}")
+    write("FORMA PAGAMENTO Valor pago R$")
+    write(f"Cartão de Débito {format_brl(total)}")
+    write("Consulte pela Chave de Acesso em")
+    write("http://nfce.set.rn.gov.br/portalDFE/NFCe/ConsultaNFCe.aspx")
+    key = access_key(rng)
+    write(" ".join(key[index:index + 4] for index in range(0, 44, 4)))
+    write("CONSUMIDOR NÃO IDENTIFICADO")
+    write(f"NFC-e nº {int(key[25:34]):09d} Série {int(key[22:25]):03d} 01/05/2024 10:{rng.randint(10, 59)}:00")
+    write(f"Protocolo de autorização: 3242400{rng.randint(10**7, 10**8 - 1)}")
+    write("Data de autorização: 01/05/2024 10:00:00")
+    pdf.save()
+    return buffer.getvalue()
+
+
+def generate_corpus(directory, files=10, items=30, pages=1, description_words=3, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(files):
+        path = os.path.join(directory, f"danfe_{index:05d}.pdf")
+        with open(path, "wb") as pdf_file:
+            pdf_file.write(make_danfe(items, pages, description_words, seed + index))
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gerar PDFs sintéticos com o layout de NFC-e DANFE.")
+    parser.add_argument("directory", help="diretório de saída")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--items", type=int, default=30, help="itens por nota")
+    parser.add_argument("--pages", type=int, default=1, help="páginas mínimas por nota")
+    parser.add_argument("--description-words", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    paths = generate_corpus(args.directory, args.files, args.items, args.pages, args.description_words, args.seed)
+    print(f"{len(paths)} PDF(s) gerados em {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+import hashlib
+import marshal
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Formato dos resultados gravados: assinatura, tipo de serialização ("m",
+# marshal) e o corpo comprimido com zlib. O diretório é compartilhado entre
+# processos, então nenhum formato que execute código ao ser lido (como o
+# pickle) é aceito
+PAYLOAD_MAGIC = b"NFCE1"
+PAYLOAD_MARSHAL = b"m"
+PAYLOAD_SUFFIX = ".nfce"
+
+# Ao passar do limite, o armazenamento em disco é reduzido a esta fração
+# dele, para que a varredura do diretório não se repita a cada gravação
+EVICT_TARGET = 0.9
+
+
+def content_key(digest, parser_version):
+    # A chave combina o hash do conteúdo do PDF (dedup.content_digest) com a
+    # versão do parser, assim uma mudança no parser invalida automaticamente
+    # os resultados antigos
+    key = hashlib.sha256()
+    key.update(str(parser_version).encode("utf-8"))
+    key.update(b"\0")
+    key.update(digest.encode("ascii"))
+    return key.hexdigest()
+
+
+def _serialize(value):
+    # As linhas extraídas são listas de textos, o total é um número e a
+    # identificação um dicionário simples: tipos que o marshal cobre com um
+    # formato compacto e rápido
+    return marshal.dumps(value)
+
+
+def _encode(body):
+    return PAYLOAD_MAGIC + PAYLOAD_MARSHAL + zlib.compress(body)
+
+
+def encode_result(value):
+    return _encode(_serialize(value))
+
+
+def decode_result(payload):
+    # (valor, tamanho descomprimido); ValueError para entradas inválidas ou
+    # de outro tipo de serialização
+    header = len(PAYLOAD_MAGIC)
+    if payload[:header] != PAYLOAD_MAGIC or payload[header:header + 1] != PAYLOAD_MARSHAL:
+        raise ValueError("Entrada de cache em formato desconhecido")
+    try:
+        body = zlib.decompress(payload[header + 1:])
+        return marshal.loads(body), len(body)
+    except Exception as exc:
+        raise ValueError(f"Entrada de cache corrompida: {exc}") from exc
+
+
+@contextmanager
+def file_lock(path):
+    # Trava exclusiva entre processos sobre o arquivo `path`
+    with open(path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class LocalDiskStore:
+    # Armazenamento endereçado por conteúdo em um diretório local, que pode
+    # ser compartilhado por vários processos (os workers do Streamlit, a linha
+    # de comando). Cada entrada é um arquivo <dir>/<chave[:2]>/<chave>.nfce
+    # gravado de forma atômica. O tamanho total fica registrado em <dir>/.size
+    # e é atualizado a cada gravação sob uma trava de arquivo; só quando ele
+    # passa do limite o diretório é percorrido, recalculando o total e
+    # removendo as entradas acessadas há mais tempo (LRU pelo mtime).
+    #
+    # Outro armazenamento (um servidor de cache, por exemplo) pode substituí-lo
+    # em ExtractionCache desde que ofereça get, put, remove e clear sobre bytes.
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._lock_path = os.path.join(self.root, ".lock")
+        self._size_path = os.path.join(self.root, ".size")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cache_file:
+                payload = cache_file.read()
+        except OSError:
+            return None
+        # Atualizar o mtime para que a remoção por tamanho seja do tipo LRU
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return payload
+
+    def put(self, key, payload):
+        path = self._path(key)
+        # A chave identifica o conteúdo: uma entrada já gravada por outro
+        # processo não precisa ser regravada
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Gravar num arquivo temporário e renomear, para nunca deixar
+        # uma entrada pela metade caso o processo seja interrompido
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(payload)
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        self._add_size(len(payload))
+
+    def remove(self, key):
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        self._add_size(-size)
+
+    def clear(self):
+        with file_lock(self._lock_path):
+            for path, _, _ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._write_size(0)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}{PAYLOAD_SUFFIX}")
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith(PAYLOAD_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, info.st_mtime, info.st_size))
+        return entries
+
+    def _read_size(self):
+        try:
+            with open(self._size_path, encoding="ascii") as size_file:
+                return int(size_file.read())
+        except (OSError, ValueError):
+            return None
+
+    def _write_size(self, total):
+        with open(self._size_path, "w", encoding="ascii") as size_file:
+            size_file.write(str(total))
+
+    def _add_size(self, delta):
+        # O total registrado é uma estimativa (duas gravações simultâneas da
+        # mesma chave o contam duas vezes); cada varredura o corrige
+        with file_lock(self._lock_path):
+            total = self._read_size()
+            if total is None:
+                total = sum(size for _, _, size in self._entries())
+            else:
+                total = max(0, total + delta)
+            if total > self.max_bytes:
+                total = self._evict()
+            self._write_size(total)
+
+    def _evict(self):
+        # Chamado com a trava: remover primeiro os arquivos acessados há mais
+        # tempo, até EVICT_TARGET do limite. Retorna o novo total.
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * EVICT_TARGET
+        for path, _, size in sorted(entries, key=lambda entry: entry[1]):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        return total
+
+
+class ExtractionCache:
+    # Cache de resultados de extração em dois níveis: memória (LRU), no
+    # processo, e um armazenamento compartilhado opcional (LocalDiskStore em
+    # `disk_dir`, ou outro passado em `store`). Os resultados vão para o
+    # armazenamento no formato binário de encode_result, e qualquer processo
+    # que use o mesmo armazenamento reaproveita as extrações dos demais.
+
+    def __init__(self, max_memory_bytes=64 * 1024 * 1024, disk_dir=None, max_disk_bytes=512 * 1024 * 1024, store=None):
+        self.max_memory_bytes = max_memory_bytes
+        if store is None and disk_dir:
+            store = LocalDiskStore(disk_dir, max_disk_bytes)
+        self.store = store
+
+        self._memory = OrderedDict()  # chave -> (valor, tamanho)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return entry[0]
+
+        value = self._read_store(key)
+        if value is not None:
+            value, size = value
+            with self._lock:
+                self.hits += 1
+                self.disk_hits += 1
+                self._store_memory(key, value, size)
+            return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        body = _serialize(value)
+        with self._lock:
+            self._store_memory(key, value, len(body))
+        if self.store is not None:
+            try:
+                self.store.put(key, _encode(body))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions + getattr(self.store, "evictions", 0),
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "shared": self.store is not None,
+            }
+
+    def _read_store(self, key):
+        # (valor, tamanho) do armazenamento compartilhado, ou None
+        if self.store is None:
+            return None
+        try:
+            payload = self.store.get(key)
+        except OSError:
+            return None
+        if payload is None:
+            return None
+        try:
+            return decode_result(payload)
+        except ValueError:
+            # Entrada corrompida ou de outro formato: descartar e extrair de novo
+            self.store.remove(key)
+            return None
+
+    def _store_memory(self, key, value, size):
+        # Itens maiores que o limite inteiro não entram na memória
+        if size > self.max_memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous[1]
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+
+        # Remover os itens menos usados até caber no limite
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self.evictions += 1
@@ -0,0 +1,80 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from memo import LruMemo
+
+# Acima desses limites os gráficos deixam de ter uma fatia/barra por PDF:
+# as menores contribuições são somadas em "Outros" e as barras passam a
+# representar faixas de PDFs consecutivos, então o tamanho do gráfico
+# enviado ao navegador não cresce com o lote
+MAX_PIE_SLICES = 12
+MAX_BARS = 100
+OTHERS_LABEL = "Outros"
+
+# Figuras recentes, indexadas pela impressão digital dos dados
+_MEMO = LruMemo(32)
+
+
+def frame_fingerprint(frame):
+    # Hash do conteúdo (colunas e valores) de um DataFrame pequeno, como as
+    # tabelas de estatísticas; é bem mais barato que montar a figura
+    digest = hashlib.sha1()
+    digest.update("\0".join(map(str, frame.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def group_small(frame, names, values, max_groups=MAX_PIE_SLICES, others_label=OTHERS_LABEL):
+    # As `max_groups - 1` linhas de maior valor e uma linha "Outros" com a
+    # soma das demais (apenas quando há mais de `max_groups` linhas)
+    if len(frame) <= max_groups:
+        return frame[[names, values]]
+    ranked = frame.nlargest(max_groups - 1, values)
+    rest = frame[values].sum() - ranked[values].sum()
+    others = pd.DataFrame({names: [f"{others_label} ({len(frame) - len(ranked)})"], values: [rest]})
+    return pd.concat([ranked[[names, values]], others], ignore_index=True)
+
+
+def bucket_series(frame, names, values, max_bars=MAX_BARS):
+    # Soma de `values` em no máximo `max_bars` faixas de linhas consecutivas,
+    # rotuladas pelo primeiro e pelo último nome da faixa
+    if len(frame) <= max_bars:
+        return frame[[names, values]]
+    bounds = np.linspace(0, len(frame), max_bars + 1).astype("int64")
+    starts, ends = bounds[:-1], bounds[1:] - 1
+    labels = frame[names].to_numpy()
+    sums = np.add.reduceat(np.nan_to_num(frame[values].to_numpy(dtype="float64")), starts)
+    return pd.DataFrame({names: [f"{labels[start]}–{labels[end]}" for start, end in zip(starts, ends)], values: sums})
+
+
+def per_file_bar(per_file):
+    def build():
+        data = bucket_series(per_file, "PDF", "Valor Total (R$)")
+        title = "Valor Total de cada PDF" if len(data) == len(per_file) else "Valor Total por faixa de PDFs"
+        return px.bar(data, x="PDF", y="Valor Total (R$)", title=title)
+    return _MEMO.memoize(("per_file_bar", frame_fingerprint(per_file)), build)
+
+
+def contribution_pie(per_file):
+    def build():
+        data = group_small(per_file, "PDF", "Contribuição (%)")
+        return px.pie(data, values="Contribuição (%)", names="PDF", title="Contribuição Percentual de cada PDF para o Valor Total")
+    return _MEMO.memoize(("contribution_pie", frame_fingerprint(per_file)), build)
+
+
+def top_products_bar(top_products):
+    def build():
+        figure = px.bar(top_products, x="Gasto (R$)", y="Descrição", orientation="h", title="Produtos com Maior Gasto")
+        figure.update_yaxes(autorange="reversed")
+        return figure
+    return _MEMO.memoize(("top_products_bar", frame_fingerprint(top_products)), build)
+
+
+def monthly_bar(monthly):
+    return _MEMO.memoize(
+        ("monthly_bar", frame_fingerprint(monthly)),
+        lambda: px.bar(monthly, x="Mês", y="Valor Total (R$)", title="Valor Total por Mês"),
+    )
@@ -0,0 +1,335 @@
+import argparse
+import csv
+import glob
+import itertools
+import json
+import os
+import sys
+
+# Importar apenas os módulos de extração: o modo em lote não depende de
+# streamlit nem de plotly, o que deixa a inicialização bem mais rápida
+from archives import ARCHIVE_EXTENSIONS, MAX_UNCOMPRESSED_BYTES, is_archive, iter_archive
+from backends import PDF_BACKENDS, REFERENCE_BACKEND
+from extractor import COLUMNS, DEFAULT_PARSER, PAGE_PARSERS, calibrate_backend, is_xml_document, iter_rows
+from isolation import Quarantine, WorkerLimits, calibrate_isolated, iter_extract_isolated
+from parallel import default_workers, iter_extract
+from tasks import FileResult, set_error
+
+OUTPUT_COLUMNS = ["Arquivo"] + COLUMNS
+FORMATS = ("csv", "jsonl", "parquet")
+AUTO_BACKEND = "auto"
+CALIBRATION_SAMPLES = 3
+# Arquivos examinados, no máximo, em busca de amostras que o PyPDF2 consiga ler
+CALIBRATION_CANDIDATES = 10
+# Extensões procuradas nos diretórios: DANFE em PDF, XML autorizado da NFC-e
+# e arquivos compactados com esses documentos
+DOCUMENT_EXTENSIONS = (".pdf", ".xml") + ARCHIVE_EXTENSIONS
+
+
+def discover_pdfs(inputs):
+    # Expandir diretórios (recursivamente) e padrões glob em uma lista ordenada
+    # de PDFs e XMLs de NFC-e
+    paths = []
+    seen = set()
+    for entry in inputs:
+        if glob.has_magic(entry):
+            candidates = glob.glob(entry, recursive=True)
+        elif os.path.isdir(entry):
+            candidates = []
+            for root, dirs, files in os.walk(entry):
+                dirs.sort()
+                candidates.extend(os.path.join(root, name) for name in files if name.lower().endswith(DOCUMENT_EXTENSIONS))
+        else:
+            candidates = [entry]
+
+        for path in sorted(candidates):
+            if os.path.isfile(path) and path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def iter_sources(paths, done, errors, max_archive_bytes=MAX_UNCOMPRESSED_BYTES):
+    # (nome, origem) de cada documento a extrair. Os arquivos compactados são
+    # descompactados membro a membro, à medida que o pool pede novos arquivos,
+    # e cada membro é registrado no ponto de controle como "arquivo/membro".
+    # Um arquivo compactado inválido ou acima do limite vai para `errors`.
+    for path in paths:
+        if not is_archive(path):
+            yield path, path
+            continue
+        try:
+            for name, data in iter_archive(path, max_archive_bytes):
+                member_path = f"{path}/{name}"
+                if member_path not in done:
+                    yield member_path, data
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            errors.append((path, error))
+            print(f"Erro ao descompactar '{path}': {error}", file=sys.stderr)
+
+
+def iter_streamed(sources, parser=None, backend=None):
+    # Modo de um único processo: cada resultado traz em `data` um gerador das
+    # linhas, lidas página a página enquanto são gravadas, então a memória não
+    # cresce com o tamanho do documento. Os erros de extração só aparecem ao
+    # consumir `data`.
+    for index, (name, source) in enumerate(sources):
+        yield FileResult(index=index, name=name, data=iter_rows(source, parser, backend=backend))
+
+
+def guess_format(output_path):
+    extension = os.path.splitext(output_path)[1].lower().lstrip(".")
+    return extension if extension in FORMATS else "csv"
+
+
+class Checkpoint:
+    # Registro em JSONL dos arquivos já gravados na saída. Cada linha guarda o
+    # tamanho da saída naquele momento, para descartar dados parciais ao retomar.
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.output_offset = 0
+        self.parts = []
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as checkpoint_file:
+                for line in checkpoint_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Última linha incompleta de uma execução interrompida
+                        break
+                    if "path" in entry:
+                        self.done.add(entry["path"])
+                    if "offset" in entry:
+                        self.output_offset = entry["offset"]
+                    if "part" in entry:
+                        self.parts.append(entry["part"])
+
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, entries):
+        for entry in entries:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class TextWriter:
+    # Saída CSV ou JSONL, gravada em modo de acréscimo
+
+    def __init__(self, path, output_format, checkpoint):
+        self.output_format = output_format
+        self.checkpoint = checkpoint
+        resuming = os.path.exists(path) and checkpoint.done
+        if resuming:
+            # Descartar o que foi gravado depois do último ponto de controle
+            with open(path, "r+b") as output_file:
+                output_file.truncate(checkpoint.output_offset)
+        self._file = open(path, "a" if resuming else "w", encoding="utf-8", newline="")
+        self._csv = csv.writer(self._file) if output_format == "csv" else None
+        if self._csv is not None and not resuming:
+            self._csv.writerow(OUTPUT_COLUMNS)
+        self._committed = self._file.tell()
+
+    def write(self, name, rows, entry):
+        # rows pode ser um gerador: as linhas são gravadas à medida que chegam.
+        # Retorna o número de linhas gravadas.
+        count = 0
+        for row in rows:
+            if self._csv is not None:
+                self._csv.writerow([name] + row)
+            else:
+                self._file.write(json.dumps(dict(zip(OUTPUT_COLUMNS, [name] + row)), ensure_ascii=False) + "\n")
+            count += 1
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        entry["rows"] = count
+        entry["offset"] = self._committed = self._file.tell()
+        self.checkpoint.record([entry])
+        return count
+
+    def discard(self):
+        # Descartar as linhas gravadas depois do último ponto de controle
+        self._file.seek(self._committed)
+        self._file.truncate()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    # Saída Parquet: um diretório com arquivos part-NNNNN.parquet, cada um
+    # gravado de forma atômica e registrado no ponto de controle
+
+    def __init__(self, path, checkpoint, rows_per_part=100_000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as exc:
+            raise SystemExit("A saída Parquet requer o pacote 'pyarrow' (pip install pyarrow)") from exc
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self.checkpoint = checkpoint
+        self.rows_per_part = rows_per_part
+
+        os.makedirs(path, exist_ok=True)
+        # Remover partes que não chegaram a ser registradas
+        for name in os.listdir(path):
+            if name.endswith(".parquet") and name not in checkpoint.parts:
+                os.remove(os.path.join(path, name))
+        self._next_part = len(checkpoint.parts)
+        self._columns = [[] for _ in OUTPUT_COLUMNS]
+        self._committed = 0
+        self._pending = []
+
+    def write(self, name, rows, entry):
+        start = len(self._columns[0])
+        for row in rows:
+            for column, value in zip(self._columns, [name] + row):
+                column.append(value)
+        self._committed = len(self._columns[0])
+        entry["rows"] = self._committed - start
+        self._pending.append(entry)
+        if len(self._columns[0]) >= self.rows_per_part:
+            self.flush()
+        return entry["rows"]
+
+    def discard(self):
+        # Descartar as linhas acrescentadas depois do último arquivo registrado
+        for column in self._columns:
+            del column[self._committed:]
+
+    def flush(self):
+        if not self._pending:
+            return
+        table = self._pa.table({column: values for column, values in zip(OUTPUT_COLUMNS, self._columns)})
+        part_name = f"part-{self._next_part:05d}.parquet"
+        part_path = os.path.join(self.path, part_name)
+        self._pq.write_table(table, part_path + ".tmp")
+        os.replace(part_path + ".tmp", part_path)
+        self.checkpoint.record(self._pending + [{"part": part_name}])
+        self._next_part += 1
+        self._columns = [[] for _ in OUTPUT_COLUMNS]
+        self._committed = 0
+        self._pending = []
+
+    def close(self):
+        self.flush()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Extrair em lote os itens de PDFs de NFC-e DANFE (ou dos XMLs autorizados), sem a interface web.")
+    parser.add_argument("inputs", nargs="+", help="arquivos PDF, XML, ZIP, tar.gz ou gzip, diretórios ou padrões glob (ex.: 'notas/**/*.pdf')")
+    parser.add_argument("-o", "--output", required=True, help="arquivo de saída (.csv, .jsonl) ou diretório Parquet")
+    parser.add_argument("-f", "--format", choices=FORMATS, help="formato da saída (padrão: deduzido da extensão)")
+    parser.add_argument("-w", "--workers", type=int, default=default_workers(), help="número de processos paralelos")
+    parser.add_argument("--parser", choices=list(PAGE_PARSERS), default=DEFAULT_PARSER, help="motor de leitura das linhas de itens")
+    parser.add_argument("--backend", choices=[AUTO_BACKEND] + list(PDF_BACKENDS), default=REFERENCE_BACKEND, help="leitor de PDF; 'auto' escolhe o mais rápido que confere com o de referência em uma amostra")
+    parser.add_argument("--max-archive-mb", type=int, default=MAX_UNCOMPRESSED_BYTES // (1024 * 1024), help="limite de MB descompactados por arquivo ZIP, tar.gz ou gzip")
+    parser.add_argument("--isolated", action="store_true", help="modo isolado: tempo limite por arquivo, teto de memória por processo e quarentena")
+    parser.add_argument("--timeout", type=float, default=WorkerLimits.timeout, help="modo isolado: tempo limite por tarefa (arquivo ou bloco de páginas), em segundos")
+    parser.add_argument("--worker-memory-mb", type=int, default=WorkerLimits.memory_mb, help="modo isolado: teto de memória de cada processo, em MB")
+    parser.add_argument("--max-tasks-per-worker", type=int, default=WorkerLimits.max_tasks, help="modo isolado: tarefas por processo antes de reiniciá-lo")
+    parser.add_argument("--quarantine", help="modo isolado: registro JSONL da quarentena (padrão: <saída>.quarantine)")
+    parser.add_argument("--checkpoint", help="arquivo de ponto de controle (padrão: <saída>.checkpoint)")
+    parser.add_argument("--no-resume", action="store_true", help="ignorar um ponto de controle existente e recomeçar")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    output_format = args.format or guess_format(args.output)
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+    if args.no_resume and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    paths = discover_pdfs(args.inputs)
+    checkpoint = Checkpoint(checkpoint_path)
+    pending = [path for path in paths if path not in checkpoint.done]
+    print(f"{len(paths)} arquivo(s) encontrados, {len(paths) - len(pending)} já processados, {len(pending)} pendentes", file=sys.stderr)
+
+    if output_format == "parquet":
+        writer = ParquetWriter(args.output, checkpoint)
+    else:
+        writer = TextWriter(args.output, output_format, checkpoint)
+
+    limits = quarantine = None
+    if args.isolated:
+        limits = WorkerLimits(timeout=args.timeout, memory_mb=args.worker_memory_mb, max_tasks=args.max_tasks_per_worker)
+        quarantine = Quarantine(args.quarantine or f"{args.output}.quarantine")
+
+    backend = args.backend
+    if backend == AUTO_BACKEND:
+        # A calibração usa apenas PDFs; os XMLs não passam pelo leitor
+        samples = list(itertools.islice((path for path in pending if not is_archive(path) and not is_xml_document(path)), CALIBRATION_CANDIDATES))
+        backend = REFERENCE_BACKEND
+        if samples:
+            if args.isolated:
+                # No modo isolado, a amostra é lida sob os mesmos limites da extração
+                calibration = calibrate_isolated(((path, path) for path in samples), args.parser, limits, quarantine, CALIBRATION_SAMPLES)
+            else:
+                calibration = calibrate_backend(samples, args.parser, max_samples=CALIBRATION_SAMPLES)
+            if calibration is None:
+                print(f"Leitor de PDF: {backend} (nenhum PDF da amostra pôde ser lido para a calibração)", file=sys.stderr)
+            else:
+                backend = calibration.backend
+                timings = ", ".join(f"{name} {seconds:.2f}s{'' if calibration.matches[name] else ' (divergente)'}" for name, seconds in calibration.seconds.items())
+                print(f"Leitor de PDF: {backend} ({timings})", file=sys.stderr)
+
+    row_count = 0
+    error_count = 0
+    processed = 0
+    quarantined = 0
+    rejected = 0
+    saved_seconds = 0.0
+    archive_errors = []
+    sources = iter_sources(pending, checkpoint.done, archive_errors, args.max_archive_mb * 1024 * 1024)
+    # Com um único processo (sem o modo isolado) as linhas vão para a saída página a página
+    streamed = not args.isolated and args.workers == 1
+    if args.isolated:
+        results = iter_extract_isolated(sources, args.workers, parser=args.parser, backend=backend, limits=limits, quarantine=quarantine)
+    elif streamed:
+        results = iter_streamed(sources, args.parser, backend)
+    else:
+        results = iter_extract(sources, max_workers=args.workers, parser=args.parser, backend=backend)
+    try:
+        for result in results:
+            processed += 1
+            entry = {"path": result.name}
+            if result.error is None:
+                try:
+                    row_count += writer.write(result.name, result.data, entry)
+                    continue
+                except Exception as exc:
+                    if not streamed:
+                        raise
+                    # Erro no meio do documento: descartar as linhas já gravadas
+                    writer.discard()
+                    set_error(result, exc)
+            error_count += 1
+            quarantined += result.quarantined
+            rejected += result.rejected
+            saved_seconds += result.saved_seconds
+            entry["error"] = result.error
+            print(f"Erro ao processar '{result.name}': {result.error}", file=sys.stderr)
+            writer.write(result.name, [], entry)
+    finally:
+        writer.close()
+        checkpoint.close()
+
+    error_count += len(archive_errors)
+    if rejected:
+        print(f"Triagem: {rejected} PDF(s) que não são DANFE de NFC-e rejeitado(s), ~{saved_seconds:.2f}s poupados", file=sys.stderr)
+    print(f"{processed} documento(s) processados, {row_count} itens gravados, {error_count} erro(s), {quarantined} em quarentena", file=sys.stderr)
+    return 1 if error_count else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
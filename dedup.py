@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def content_digest(pdf_bytes):
+    # Identifica o arquivo pelo conteúdo, independentemente da versão do leitor
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+class DocumentIndex:
+    # Índice de NFC-e já processadas, pelo hash do arquivo e pela chave de
+    # acesso, compartilhado entre as sessões do processo. Com `path`, cada
+    # documento é também acrescentado a um arquivo JSONL, e o índice sobrevive
+    # a reinícios do servidor.
+
+    def __init__(self, path=None):
+        self.path = path
+        self._by_digest = {}
+        self._by_access_key = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def __len__(self):
+        return len(self._by_digest)
+
+    def lookup(self, digest=None, access_key=None, exclude_owner=None):
+        # Registro de um documento já visto por outro dono (outra sessão), ou None
+        with self._lock:
+            for record in (self._by_digest.get(digest), self._by_access_key.get(access_key)):
+                if record is not None and record["owner"] != exclude_owner:
+                    return record
+        return None
+
+    def add(self, digest, header, name, owner):
+        access_key = (header or {}).get("access_key")
+        with self._lock:
+            if digest in self._by_digest or (access_key and access_key in self._by_access_key):
+                return
+            record = {"digest": digest, "access_key": access_key, "name": name, "owner": owner, "seen_at": time.time()}
+            self._remember(record)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as index_file:
+                    index_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _remember(self, record):
+        self._by_digest[record["digest"]] = record
+        if record["access_key"]:
+            self._by_access_key[record["access_key"]] = record
+
+    def _load(self, path):
+        with open(path, encoding="utf-8") as index_file:
+            for line in index_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última linha incompleta (servidor interrompido durante a escrita)
+                    continue
+                self._remember(record)
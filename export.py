@@ -0,0 +1,147 @@
+import io
+import math
+import re
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+import pandas as pd
+import xlsxwriter
+
+from extractor import COLUMNS
+
+EXCEL_MAX_ROWS = 1_048_576
+SHEET_NAME_LIMIT = 31
+WRITE_CHUNK_ROWS = 10_000
+INVALID_SHEET_CHARS = re.compile(r"[\[\]:*?/\\]")
+
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+@dataclass
+class ExportReport:
+    rows: int
+    sheets: int
+    seconds: float
+    peak_traced_mb: float
+    size_bytes: int
+
+
+def excel_sheet_name(name, used):
+    # Nome de planilha válido no Excel: até 31 caracteres, sem []:*?/\ e único
+    base = INVALID_SHEET_CHARS.sub("_", name)[:SHEET_NAME_LIMIT] or "Planilha"
+    candidate = base
+    suffix = 2
+    while candidate.lower() in used:
+        tail = f"~{suffix}"
+        candidate = base[:SHEET_NAME_LIMIT - len(tail)] + tail
+        suffix += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def _cell(value):
+    # Células vazias no lugar de NaN e pd.NA (o xlsxwriter não grava NaN como número)
+    if value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+def _write_streaming(table, output):
+    # Modo constant_memory: cada linha é gravada em arquivo temporário assim que
+    # escrita, então o uso de memória não cresce com o número de itens
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    bold = workbook.add_format({"bold": True})
+    money = workbook.add_format({"num_format": "#,##0.00"})
+
+    index_sheet = workbook.add_worksheet("Índice")
+    index_sheet.write_row(0, 0, ["PDF", "Arquivo", "Itens", "Valor Total (R$)", "Planilha", "Linha inicial"], bold)
+
+    header = ["PDF", "Arquivo"] + COLUMNS
+    item_sheets = []
+    frame = table.frame
+
+    sheet = None
+    sheet_row = EXCEL_MAX_ROWS
+    file_starts = {}
+    # Converter a tabela em valores Python por blocos, para não materializar
+    # o lote inteiro como objetos de uma só vez
+    for chunk_start in range(0, len(frame), WRITE_CHUNK_ROWS):
+        chunk = frame.iloc[chunk_start:chunk_start + WRITE_CHUNK_ROWS]
+        file_ids = chunk["PDF"].tolist()
+        columns = [chunk[column].tolist() for column in COLUMNS]
+        for file_id, values in zip(file_ids, zip(*columns)):
+            if sheet_row >= EXCEL_MAX_ROWS:
+                # Limite de linhas do Excel atingido: continuar em uma nova planilha
+                sheet = workbook.add_worksheet("Itens" if not item_sheets else f"Itens {len(item_sheets) + 1}")
+                sheet.write_row(0, 0, header, bold)
+                sheet.set_column(6, 7, None, money)
+                item_sheets.append(sheet)
+                sheet_row = 1
+            file_starts.setdefault(file_id, (sheet.get_name(), sheet_row + 1))
+            sheet.write_row(sheet_row, 0, [file_id + 1, table.file_names[file_id]] + [_cell(value) for value in values])
+            sheet_row += 1
+
+    if not item_sheets:
+        sheet = workbook.add_worksheet("Itens")
+        sheet.write_row(0, 0, header, bold)
+        item_sheets.append(sheet)
+
+    # O índice é gravado por último, mas como está em outra planilha isso
+    # não viola a ordem de linhas exigida pelo modo constant_memory
+    totals = table.file_totals()
+    counts = table.offsets[1:] - table.offsets[:-1]
+    for file_id, name in enumerate(table.file_names):
+        sheet_name, start_row = file_starts.get(file_id, ("", None))
+        index_sheet.write_row(file_id + 1, 0, [file_id + 1, name, int(counts[file_id])])
+        index_sheet.write_number(file_id + 1, 3, float(totals[file_id]), money)
+        if start_row is not None:
+            index_sheet.write_url(file_id + 1, 4, f"internal:'{sheet_name}'!A{start_row}", string=sheet_name)
+            index_sheet.write_number(file_id + 1, 5, start_row)
+
+    workbook.close()
+    return len(frame), len(item_sheets) + 1
+
+
+def _write_per_file(table, output):
+    # Uma planilha por PDF, como no modo original, com nomes dentro do limite do Excel
+    totals = table.file_totals()
+    used = set()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        for idx, total_value in enumerate(totals):
+            sheet_name = excel_sheet_name(f"Sheet{idx+1}_Total_{total_value:.2f}", used)
+            table.file_frame(idx).to_excel(writer, sheet_name=sheet_name, index=False)
+    return len(table.frame), table.file_count
+
+
+def export_excel(table, streaming=True, trace_memory=False):
+    # Gerar o Excel em memória (para download), sem gravar no diretório do servidor.
+    # Com trace_memory, o pico de memória alocada durante a exportação é medido
+    # com o tracemalloc (que deixa a gravação mais lenta); senão fica NaN
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif trace_memory:
+        tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+    try:
+        started = time.perf_counter()
+        output = io.BytesIO()
+        if streaming:
+            rows, sheets = _write_streaming(table, output)
+        else:
+            rows, sheets = _write_per_file(table, output)
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] - baseline if trace_memory else float("nan")
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    report = ExportReport(
+        rows=rows,
+        sheets=sheets,
+        seconds=seconds,
+        peak_traced_mb=peak / 1024 / 1024,
+        size_bytes=output.getbuffer().nbytes,
+    )
+    output.seek(0)
+    return output, report
@@ -0,0 +1,688 @@
+import io
+import mmap
+import os
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+from contextlib import contextmanager
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+from backends import PDF_BACKENDS, REFERENCE_BACKEND, get_backend
+from memo import LruMemo
+from profiling import NULL_PROFILER
+
+# Incrementar sempre que a lógica de extração mudar, para invalidar o cache
+PARSER_VERSION = "6"
+
+# Arquivos em disco a partir deste tamanho são mapeados em memória em vez de lidos
+MMAP_THRESHOLD = 32 * 1024 * 1024
+
+COLUMNS = ["Item", "Descrição", "Qtde.", "Unid.", "Vl. unid.", "Vl. total"]
+
+TABLE_HEADER = "Item Descrição Qtde. Unid. Vl. unid. Vl. total"
+
+# Linha candidata a item: número do item seguido do restante da linha.
+# As linhas que não começam com dígitos são descartadas pelo próprio regex.
+ITEM_LINE_RE = re.compile(r"^[^\S\n]*([0-9]+)[^\S\n]+([^\n]*)$", re.MULTILINE)
+
+# Início do rodapé do DANFE: depois destes blocos não há mais itens
+FOOTER_RE = re.compile(r"Qtd\. total de itens|Valor total R\$|Valor a pagar R\$|FORMA (?:DE )?PAGAMENTO|Consulte pela Chave de Acesso", re.IGNORECASE)
+
+# Chave de acesso: 44 dígitos, normalmente impressos em 11 grupos de 4
+ACCESS_KEY_RE = re.compile(r"(?<!\d)((?:\d{4}[ \t]?){10}\d{4})(?!\d)")
+# Linha de identificação: "NFC-e nº 123 Série 1 [Emissão] 01/05/2024 10:00:00"
+ITEM_COUNT_RE = re.compile(r"Qtd\. total de itens:?\s*(\d+)", re.IGNORECASE)
+NFCE_NUMBER_RE = re.compile(r"NFC-e\s*n\S*\s*(\d+)\s*S[ée]rie:?\s*(\d+)(?:[^\n\d]*(\d{2})/(\d{2})/(\d{4})[ \t]+(\d{2}:\d{2}(?::\d{2})?))?", re.IGNORECASE)
+
+# Triagem: a primeira página de um DANFE de NFC-e traz o título do documento
+# ou o cabeçalho da tabela de itens. Um PDF sem nenhum deles nem linhas de
+# itens na primeira página é rejeitado antes de extrair as demais páginas.
+DANFE_SIGNATURE_RE = re.compile(r"Consumidor\s+Eletr[ôo]nica|NFC-e|Item\s+Descri[çc][ãa]o\s+Qtde", re.IGNORECASE)
+
+# XML autorizado da NFC-e (nfeProc/NFe): campos de cada item em det/prod,
+# na ordem das colunas, com as casas decimais mínimas dos números no DANFE
+# (None para texto)
+XML_ITEM_FIELDS = (("xProd", None), ("qCom", 0), ("uCom", None), ("vUnCom", 2), ("vProd", 2))
+XML_HEAD_BYTES = 64
+
+# Mapas de páginas já conhecidos neste processo, pelo hash do conteúdo
+# (dedup.content_digest) e pela versão de cache_version: outro leitor ou
+# parser pode classificar as páginas de outra forma
+PAGE_MAP_CACHE_SIZE = 4096
+_page_maps = LruMemo(PAGE_MAP_CACHE_SIZE)
+
+class NotDanfeError(ValueError):
+    # PDF rejeitado pela triagem; saved_seconds estima o tempo poupado com as
+    # páginas que não foram lidas
+
+    def __init__(self, message, saved_seconds=0.0):
+        super().__init__(message, saved_seconds)
+
+    def __str__(self):
+        return self.args[0]
+
+    @property
+    def saved_seconds(self):
+        return self.args[1]
+
+@dataclass
+class BackendCalibration:
+    # Leitor escolhido e, por leitor, o tempo total na amostra e se as linhas
+    # lidas conferem com as do leitor de referência
+    backend: str
+    seconds: dict
+    matches: dict
+
+@dataclass(frozen=True)
+class ItemRecord:
+    # Item da NFC-e com os números já convertidos (None quando ilegíveis),
+    # produzido por iter_items
+    item: Optional[int]
+    description: str
+    quantity: Optional[float]
+    unit: str
+    unit_price: Optional[float]
+    total: Optional[float]
+
+@dataclass(frozen=True)
+class PageMap:
+    # Resultado da classificação das páginas de um documento: quais páginas
+    # têm linhas de itens e em qual página começa o rodapé
+    page_count: int
+    item_pages: tuple
+    footer_page: int = None
+    header: dict = None
+
+def valid_access_key(access_key):
+    # Dígito verificador da chave de acesso: módulo 11 com pesos de 2 a 9
+    if len(access_key) != 44 or not access_key.isdigit():
+        return False
+    weights = (2, 3, 4, 5, 6, 7, 8, 9)
+    total = sum(int(digit) * weights[index % 8] for index, digit in enumerate(reversed(access_key[:43])))
+    check = 11 - total % 11
+    return int(access_key[43]) == (0 if check >= 10 else check)
+
+def parse_document_header(text):
+    # Identificação da NFC-e no rodapé: chave de acesso, número, série, data
+    # de emissão e CNPJ do emitente (posições 7 a 20 da chave de acesso)
+    header = {"access_key": None, "number": None, "series": None, "issued_at": None, "cnpj": None, "item_count": None}
+    for match in ACCESS_KEY_RE.finditer(text):
+        access_key = re.sub(r"\s", "", match.group(1))
+        if valid_access_key(access_key):
+            header["access_key"] = access_key
+            header["cnpj"] = access_key[6:20]
+            break
+    match = NFCE_NUMBER_RE.search(text)
+    if match is not None:
+        header["number"] = int(match.group(1))
+        header["series"] = int(match.group(2))
+        if match.group(3):
+            day, month, year, clock = match.group(3, 4, 5, 6)
+            header["issued_at"] = f"{year}-{month}-{day} {clock}"
+    match = ITEM_COUNT_RE.search(text)
+    if match is not None:
+        header["item_count"] = int(match.group(1))
+    return header
+
+def rows_consistent(data, header):
+    # Conferir as linhas lidas com o próprio documento: itens numerados de 1
+    # a N e, quando o rodapé informa, N igual à "Qtd. total de itens"
+    item_count = (header or {}).get("item_count")
+    if item_count is not None and item_count != len(data):
+        return False
+    return all(row[0].isdigit() and int(row[0]) == position for position, row in enumerate(data, start=1))
+
+def item_region(text):
+    # Cortar o texto da página no início do rodapé (totais, pagamento, chave
+    # de acesso, consumidor e protocolo). Retorna o trecho e se havia rodapé.
+    header_index = text.find(TABLE_HEADER)
+    match = FOOTER_RE.search(text, max(header_index, 0))
+    if match is None:
+        return text, False
+    return text[:match.start()], True
+
+def get_page_map(digest, parser=None, backend=None):
+    return _page_maps.get((digest, cache_version(parser, backend)))
+
+def remember_page_map(digest, page_map, parser=None, backend=None):
+    _page_maps.put((digest, cache_version(parser, backend)), page_map)
+
+def build_page_map(page_count, scanned_pages, footer_page, header=None):
+    item_pages = tuple(page_index for page_index, page_data in scanned_pages if page_data and (footer_page is None or page_index <= footer_page))
+    return PageMap(page_count=page_count, item_pages=item_pages, footer_page=footer_page, header=header)
+
+def parse_page_text(text):
+    # Inicializar a lista de linhas da página
+    data = []
+
+    # Processar o texto extraído para obter os dados da tabela
+    lines = text.split('\n')
+
+    # Encontrar o índice de início das linhas de dados
+    start_index = None
+    for line_index, line in enumerate(lines):
+        if TABLE_HEADER in line:
+            start_index = line_index + 1
+            break
+
+    # Iterar sobre as linhas de dados e preencher as colunas
+    last_item = None  # Último item processado
+    for line in lines[start_index:]:
+        if line.strip():
+            fields = line.split()
+            if len(fields) >= 6 and fields[0].isdigit():
+                item = fields[0]
+                if len(item) == 3 and item.isdigit():
+                    if last_item is not None:
+                        # Verificar se o próximo item é sequencial ao último item processado
+                        next_item = int(item)
+                        if next_item != last_item + 1:
+                            # Se não for sequencial, não processar a linha
+                            continue
+                descricao = ' '.join(fields[1:-4])
+                qtde = fields[-4]
+                unidade = fields[-3]
+                vl_unidade = fields[-2]
+                vl_total = fields[-1]
+                data.append([item, descricao, qtde, unidade, vl_unidade, vl_total])
+
+                last_item = int(item)
+
+    return data
+
+def parse_page_text_compiled(text):
+    # Mesmo resultado de parse_page_text, mas em uma única passagem pelo texto:
+    # o cabeçalho é localizado com str.find e as linhas de itens com um regex
+    # pré-compilado, sem split() de cada linha em Python
+    data = []
+
+    header_index = text.find(TABLE_HEADER)
+    if header_index == -1:
+        start = 0
+    else:
+        # Os dados começam na linha seguinte à do cabeçalho
+        start = text.find('\n', header_index)
+        if start == -1:
+            return data
+
+    last_item = None  # Último item processado
+    for item, rest in ITEM_LINE_RE.findall(text, start):
+        fields = rest.split()
+        if len(fields) < 5:
+            continue
+        if len(item) == 3 and last_item is not None and int(item) != last_item + 1:
+            # Se não for sequencial, não processar a linha
+            continue
+        data.append([item, ' '.join(fields[:-4]), fields[-4], fields[-3], fields[-2], fields[-1]])
+        last_item = int(item)
+
+    return data
+
+PAGE_PARSERS = {
+    "legacy": parse_page_text,
+    "compiled": parse_page_text_compiled,
+}
+DEFAULT_PARSER = "compiled"
+
+def get_page_parser(parser=None):
+    try:
+        return PAGE_PARSERS[parser or DEFAULT_PARSER]
+    except KeyError:
+        raise ValueError(f"Parser desconhecido: {parser!r} (opções: {', '.join(PAGE_PARSERS)})") from None
+
+def cache_version(parser=None, backend=None):
+    # Versão usada nas chaves de cache: inclui o parser e o leitor de PDF escolhidos
+    return f"{PARSER_VERSION}:{parser or DEFAULT_PARSER}:{backend or REFERENCE_BACKEND}"
+
+def sum_total_values(data):
+    total_value = 0
+    for row in data:
+        try:
+            vl_total_float = float(row[5].replace(',', '.'))  # Converta o valor total para float
+            total_value += vl_total_float  # Adicionar o valor total
+        except ValueError:
+            pass  # Ignorar valores não numéricos
+    return total_value
+
+def parse_brl_number(text):
+    # "1.234,56" -> 1234.56; sem vírgula, o ponto é o separador decimal, como
+    # em sum_total_values. None quando o texto não é um número.
+    if ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def to_item_record(row):
+    item, description, quantity, unit, unit_price, total = row
+    return ItemRecord(
+        item=int(item) if item.isdigit() else None,
+        description=description,
+        quantity=parse_brl_number(quantity),
+        unit=unit,
+        unit_price=parse_brl_number(unit_price),
+        total=parse_brl_number(total),
+    )
+
+class BufferStream(io.RawIOBase):
+    # Fluxo somente leitura sobre um memoryview, sem copiar o buffer de origem
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast("B")
+        self._position = 0
+
+    @property
+    def buffer(self):
+        return self._view
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = len(self._view) + offset
+        else:
+            raise ValueError(f"whence inválido: {whence}")
+        if position < 0:
+            raise ValueError("posição negativa")
+        self._position = position
+        return position
+
+    def readinto(self, target):
+        remaining = len(self._view) - self._position
+        if remaining <= 0:
+            return 0
+        size = min(len(target), remaining)
+        target[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+def _mapped_file(file_object):
+    try:
+        file_size = os.fstat(file_object.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    if file_size < MMAP_THRESHOLD:
+        return None
+    return mmap.mmap(file_object.fileno(), 0, access=mmap.ACCESS_READ)
+
+@contextmanager
+def open_pdf_stream(source):
+    # Abrir a origem do PDF como um fluxo legível pelo PdfReader sem passar
+    # por arquivos temporários. Aceita bytes/memoryview, caminhos e objetos de
+    # arquivo (como o UploadedFile do Streamlit, que é um BytesIO).
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        stream = BufferStream(source)
+        try:
+            yield stream
+        finally:
+            stream.close()
+        return
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as pdf_file:
+            mapped = _mapped_file(pdf_file)
+            if mapped is None:
+                yield io.BytesIO(pdf_file.read())
+                return
+            try:
+                yield mapped
+            finally:
+                mapped.close()
+        return
+
+    if hasattr(source, "getbuffer"):
+        # BytesIO: expor o buffer interno diretamente
+        with source.getbuffer() as view:
+            stream = BufferStream(view)
+            try:
+                yield stream
+            finally:
+                stream.close()
+        return
+
+    mapped = _mapped_file(source)
+    if mapped is not None:
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+        return
+
+    yield io.BytesIO(source.read())
+
+def is_danfe_page(text):
+    # A primeira página de um DANFE de NFC-e sempre traz o título ou o
+    # cabeçalho da tabela de itens; linhas que parecem itens não bastam (um
+    # extrato bancário numerado também as tem)
+    return DANFE_SIGNATURE_RE.search(text) is not None
+
+def iter_scanned_pages(pdf_reader, page_indexes, parse_page, profiler=NULL_PROFILER):
+    # Gerador de (índice, linhas, identificação) das páginas indicadas, parando
+    # na página em que começa o rodapé: as páginas seguintes (pagamento, QR
+    # code, protocolo) nem têm o texto extraído. A identificação da NFC-e só
+    # vem na página do rodapé (None nas demais). NotDanfeError se a primeira
+    # página não for de um DANFE de NFC-e.
+    for page_index in page_indexes:
+        page = pdf_reader.pages[page_index]
+        # Extrair texto da página atual
+        started = time.perf_counter()
+        with profiler.stage("extract_text", page=page_index) as event:
+            text = page.extract_text()
+            event["bytes"] = len(text)
+        if page_index == 0 and not is_danfe_page(text):
+            skipped = len(pdf_reader.pages) - 1
+            raise NotDanfeError(
+                f"O PDF não é um DANFE de NFC-e (rejeitado na triagem da primeira página; {skipped} página(s) não lida(s))",
+                skipped * (time.perf_counter() - started),
+            )
+        with profiler.stage("parse", page=page_index) as event:
+            region, has_footer = item_region(text)
+            page_data = parse_page(region)
+            event["rows"] = len(page_data)
+        if has_footer:
+            yield page_index, page_data, read_document_header(pdf_reader, page_index, text, profiler)
+            return
+        yield page_index, page_data, None
+
+def read_document_header(pdf_reader, footer_page, footer_text, profiler=NULL_PROFILER):
+    # A chave de acesso fica no rodapé; se não estiver na página em que ele
+    # começa, procurar nas páginas seguintes
+    with profiler.stage("header", page=footer_page):
+        header = parse_document_header(footer_text)
+        for page_index in range(footer_page + 1, len(pdf_reader.pages)):
+            if header["access_key"] is not None:
+                break
+            text = pdf_reader.pages[page_index].extract_text()
+            for field, value in parse_document_header(text).items():
+                if header[field] is None:
+                    header[field] = value
+    return header
+
+def extract_pages(source, page_indexes=None, parser=None, profiler=NULL_PROFILER, backend=None, max_pages=None):
+    # Ler só as páginas indicadas (None: as `max_pages` primeiras, ou todas),
+    # para dividir um PDF grande entre processos. Retorna (número de páginas,
+    # [(índice, linhas com item)], página do rodapé, identificação da NFC-e);
+    # as páginas depois do rodapé não são lidas.
+    parse_page = get_page_parser(parser)
+    with open_pdf_stream(source) as stream:
+        with profiler.stage("pdf_reader"):
+            pdf_reader = get_backend(backend)(stream)
+        page_count = len(pdf_reader.pages)
+        if page_indexes is None:
+            page_indexes = range(min(page_count, max_pages or page_count))
+        pages = []
+        footer_page = header = None
+        for page_index, page_data, page_header in iter_scanned_pages(pdf_reader, page_indexes, parse_page, profiler):
+            pages.append((page_index, [row for row in page_data if row[0] != '']))
+            if page_header is not None:
+                footer_page, header = page_index, page_header
+    return page_count, pages, footer_page, header
+
+def _iter_document(uploaded_file, parser, backend, profiler, verify, digest=None):
+    # Linhas de cada página assim que ela é lida; veja iter_document. Com o
+    # hash do conteúdo, o mapa de páginas é consultado e, ao final,
+    # memorizado; com `verify`, as linhas são conferidas com o rodapé
+    # (ValueError se não conferem) e o documento fica todo na memória.
+    checked = []
+    page_map = get_page_map(digest, parser, backend) if digest else None
+    with open_pdf_stream(uploaded_file) as stream:
+        with profiler.stage("pdf_reader"):
+            pdf_reader = get_backend(backend)(stream)
+
+        # Com o mapa de páginas já conhecido, ler só as páginas com itens.
+        # Das páginas lidas, o mapa só precisa saber quais tinham linhas.
+        page_indexes = page_map.item_pages if page_map else range(len(pdf_reader.pages))
+        scanned_pages = []
+        footer_page = header = None
+        for page_index, page_data, page_header in iter_scanned_pages(pdf_reader, page_indexes, get_page_parser(parser), profiler):
+            scanned_pages.append((page_index, bool(page_data)))
+            if page_header is not None:
+                footer_page, header = page_index, page_header
+            # Filtrar linhas com item vazio
+            rows = [row for row in page_data if row[0] != '']
+            if verify:
+                checked.extend(rows)
+            yield page_index, rows, None
+        if page_map is not None and page_map.header is not None:
+            header = dict(page_map.header)
+
+    if verify and not rows_consistent(checked, header):
+        raise ValueError("As linhas lidas não conferem com o rodapé do documento")
+    if page_map is None and digest:
+        remember_page_map(digest, build_page_map(len(pdf_reader.pages), scanned_pages, footer_page, header), parser, backend)
+    yield None, [], header
+
+def iter_document(source, parser=None, profiler=NULL_PROFILER, backend=None, digest=None):
+    # Gerador das linhas de um PDF ou XML de NFC-e em fluxo: (índice da página,
+    # linhas com item, None) assim que cada página é lida e, por último,
+    # (None, [], identificação da NFC-e). No XML cada item sai sozinho, sem
+    # página. Com um leitor diferente do de referência, o documento é lido
+    # inteiro antes de produzir as linhas: se o leitor não consegue lê-lo ou
+    # as linhas não conferem com o rodapé, ele é lido de novo com o de referência.
+    # Com `digest` (dedup.content_digest da origem), os mapas de páginas deste
+    # processo são usados e atualizados.
+    if is_xml_document(source):
+        yield from _iter_xml(source, profiler)
+        return
+
+    if backend in (None, REFERENCE_BACKEND):
+        yield from _iter_document(source, parser, REFERENCE_BACKEND, profiler, False, digest)
+        return
+
+    try:
+        pages = list(_iter_document(source, parser, backend, profiler, True, digest))
+    except NotDanfeError:
+        raise
+    except Exception:
+        # Um PDF que o leitor alternativo não consegue abrir ainda pode ser lido pelo de referência
+        pages = None
+    if pages is None:
+        with profiler.stage("backend_fallback", backend=backend):
+            pages = list(_iter_document(source, parser, REFERENCE_BACKEND, profiler, False, digest))
+    yield from pages
+
+def iter_rows(source, parser=None, profiler=NULL_PROFILER, backend=None):
+    # Apenas as linhas de iter_document, na ordem do documento
+    for _, rows, _ in iter_document(source, parser, profiler, backend):
+        yield from rows
+
+def iter_items(source, parser=None, profiler=NULL_PROFILER, backend=None):
+    # Itens de um PDF ou XML de NFC-e como ItemRecord, página a página: a
+    # memória usada é a de uma página, não a do documento inteiro
+    for row in iter_rows(source, parser, profiler, backend):
+        yield to_item_record(row)
+
+def collect_document(pages, profiler=NULL_PROFILER):
+    # Juntar as linhas produzidas por iter_document: (linhas, valor total, identificação)
+    data = []
+    header = None
+    for _, rows, header in pages:
+        data.extend(rows)
+    with profiler.stage("merge") as event:
+        total = sum_total_values(data)
+        event["rows"] = len(data)
+    return data, total, header
+
+def extract_document(uploaded_file, parser=None, profiler=NULL_PROFILER, backend=None, digest=None):
+    # Retorna (linhas, valor total, identificação da NFC-e)
+    return collect_document(iter_document(uploaded_file, parser, profiler, backend, digest), profiler)
+
+def extract_data_from_pdf(uploaded_file, parser=None, profiler=NULL_PROFILER, backend=None):
+    data, total, _ = extract_document(uploaded_file, parser, profiler, backend)
+    return data, total
+
+def _source_head(source, size=XML_HEAD_BYTES):
+    # Primeiros bytes da origem, sem consumir o fluxo
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:size])
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as source_file:
+            return source_file.read(size)
+    if hasattr(source, "getbuffer"):
+        with source.getbuffer() as view:
+            return bytes(view[:size])
+    position = source.tell()
+    head = source.read(size)
+    source.seek(position)
+    return head
+
+def is_xml_document(source):
+    # PDFs começam com "%PDF"; o XML da NFC-e, com "<" (após um BOM opcional)
+    return _source_head(source).lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"<")
+
+def _local_name(tag):
+    # Nome da tag sem o namespace ("{http://www.portalfiscal.inf.br/nfe}det" -> "det")
+    return tag.rpartition("}")[2]
+
+def _danfe_number(text, decimals):
+    # "5.5000000000" -> "5,50", "1234.5" -> "1.234,50", "2.0000" -> "2": o
+    # número do XML no formato das linhas do DANFE, com pelo menos `decimals`
+    # casas e sem os demais zeros à direita
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        return text
+    integer, _, fraction = f"{value:,f}".partition(".")
+    fraction = fraction.rstrip("0").ljust(decimals, "0")
+    integer = integer.replace(",", ".")
+    return f"{integer},{fraction}" if fraction else integer
+
+def _xml_issued_at(value):
+    # "2024-05-01T10:00:00-03:00" -> "2024-05-01 10:00:00" (horário local da emissão)
+    if not value:
+        return None
+    date, _, clock = value.partition("T")
+    return f"{date} {clock[:8]}" if clock else f"{date} 00:00:00"
+
+def _iter_xml(source, profiler=NULL_PROFILER):
+    # Ler o XML da NFC-e em fluxo: cada <det> é convertido em uma linha com as
+    # mesmas seis colunas do PDF, produzida como (None, [linha], None), e
+    # descartado em seguida, então a memória não cresce com o número de itens.
+    # Por último vem (None, [], identificação), como em iter_document.
+    header = {"access_key": None, "number": None, "series": None, "issued_at": None, "cnpj": None, "item_count": None}
+    item_count = 0
+    path = []
+    with profiler.stage("xml_parse") as event, open_pdf_stream(source) as stream:
+        for action, element in ElementTree.iterparse(stream, events=("start", "end")):
+            name = _local_name(element.tag)
+            if action == "start":
+                path.append(name)
+                if name == "infNFe":
+                    access_key = element.get("Id", "")[-44:]
+                    if valid_access_key(access_key):
+                        header["access_key"] = access_key
+                continue
+
+            path.pop()
+            parent = path[-1] if path else None
+            if name == "det":
+                prod = element.find("{*}prod")
+                fields = {_local_name(child.tag): (child.text or "").strip() for child in prod} if prod is not None else {}
+                item = element.get("nItem", "")
+                row = [item.zfill(3) if item.isdigit() else item]
+                for field, decimals in XML_ITEM_FIELDS:
+                    value = fields.get(field, "")
+                    row.append(_danfe_number(value, decimals) if decimals is not None and value else value)
+                element.clear()
+                item_count += 1
+                yield None, [row], None
+            elif parent == "ide" and name == "nNF":
+                header["number"] = int(element.text)
+            elif parent == "ide" and name == "serie":
+                header["series"] = int(element.text)
+            elif parent == "ide" and name in ("dhEmi", "dEmi"):
+                header["issued_at"] = _xml_issued_at((element.text or "").strip())
+            elif parent == "emit" and name == "CNPJ":
+                header["cnpj"] = (element.text or "").strip()
+            elif parent == "infProt" and name == "chNFe" and header["access_key"] is None:
+                access_key = (element.text or "").strip()
+                if valid_access_key(access_key):
+                    header["access_key"] = access_key
+        event["rows"] = item_count
+
+    if header["access_key"] is None and not item_count:
+        raise ValueError("O XML não é de uma NFC-e (nfeProc/NFe)")
+    if header["cnpj"] is None and header["access_key"] is not None:
+        header["cnpj"] = header["access_key"][6:20]
+    header["item_count"] = item_count
+    yield None, [], header
+
+def extract_document_xml(source, profiler=NULL_PROFILER):
+    # Retorna (linhas, valor total, identificação) do XML da NFC-e
+    return collect_document(_iter_xml(source, profiler), profiler)
+
+def extract_source(source, parser=None, profiler=NULL_PROFILER, backend=None, digest=None):
+    # Extrair um PDF ou um XML de NFC-e, conforme o conteúdo da origem
+    if is_xml_document(source):
+        return extract_document_xml(source, profiler)
+    return extract_document(source, parser, profiler, backend, digest)
+
+def _read_all_pages(sample, parser=None, backend=None):
+    # Linhas e identificação do documento lido com `backend`, sem usar os
+    # mapas de páginas nem conferir com o rodapé
+    pages = _iter_document(sample, parser, backend, NULL_PROFILER, False)
+    data, _, header = collect_document(pages)
+    return data, header
+
+def measure_backends(sample, parser=None, backends=None):
+    # Ler um PDF da amostra com o leitor de referência e com cada um dos
+    # demais: {leitor: (segundos, (linhas, identificação) ou o nome do erro)}.
+    # Se o de referência não consegue lê-lo, a exceção é propagada: um arquivo
+    # corrompido ou que não é DANFE não diz nada sobre os demais leitores.
+    measurement = {}
+    for name in [REFERENCE_BACKEND] + [name for name in backends or PDF_BACKENDS if name != REFERENCE_BACKEND]:
+        started = time.perf_counter()
+        try:
+            output = _read_all_pages(sample, parser, name)
+        except Exception as exc:
+            if name == REFERENCE_BACKEND:
+                raise
+            output = type(exc).__name__
+        measurement[name] = (time.perf_counter() - started, output)
+    return measurement
+
+def summarize_calibration(measurements):
+    # Escolher, pelas medidas de measure_backends, o leitor mais rápido cujas
+    # linhas e identificação sejam idênticas às do leitor de referência em
+    # todos os PDFs da amostra; None sem nenhuma medida
+    if not measurements:
+        return None
+    seconds = {name: sum(measurement[name][0] for measurement in measurements) for name in measurements[0]}
+    matches = {name: all(measurement[name][1] == measurement[REFERENCE_BACKEND][1] for measurement in measurements) for name in seconds}
+    backend = min((name for name in seconds if matches[name]), key=seconds.get)
+    return BackendCalibration(backend=backend, seconds=seconds, matches=matches)
+
+def calibrate_backend(samples, parser=None, backends=None, max_samples=None):
+    # Ler a amostra de PDFs com cada leitor e escolher o mais rápido que
+    # confere com o de referência (ver summarize_calibration). Os mapas de
+    # páginas não são usados, para que todos leiam as mesmas páginas. Só
+    # entram na amostra os PDFs que o leitor de referência lê sem erro:
+    # `samples` é consumido até haver `max_samples` PDFs válidos; sem nenhum,
+    # retorna None.
+    measurements = []
+    for sample in samples:
+        try:
+            measurements.append(measure_backends(sample, parser, backends))
+        except Exception:
+            continue
+        if max_samples and len(measurements) >= max_samples:
+            break
+    return summarize_calibration(measurements)
@@ -0,0 +1,304 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+from multiprocessing.connection import wait
+
+from backends import PDF_BACKENDS
+from dedup import content_digest
+from extractor import measure_backends, summarize_calibration
+from parallel import default_workers
+from profiling import NULL_PROFILER, peak_rss_mb
+from tasks import DocumentTasks, describe_error, iter_scheduled, split_source
+
+try:
+    import resource  # setrlimit, para o teto de memória de cada processo
+except ImportError:  # Windows: sem teto de memória por processo
+    resource = None
+
+# Espera pelo fim de um processo que fechou a conexão, antes de ler o código de saída
+EXIT_WAIT_SECONDS = 5.0
+
+
+@dataclass(frozen=True)
+class WorkerLimits:
+    # Limites do modo isolado: tempo máximo por tarefa (um arquivo ou um bloco
+    # de páginas, em segundos), teto de memória por processo (MB) e tarefas
+    # por processo antes de reiniciá-lo
+    timeout: float = 60.0
+    memory_mb: int = 1024
+    max_tasks: int = 50
+
+
+class Quarantine:
+    # Arquivos que estouraram um limite (tempo, memória) ou derrubaram o
+    # processo, pelo hash do conteúdo: não são extraídos de novo, apenas
+    # reportados. Com `path`, o registro é mantido em um arquivo JSONL.
+
+    def __init__(self, path=None):
+        self.path = path
+        self._records = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as quarantine_file:
+                for line in quarantine_file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._records[record["digest"]] = record
+
+    def __len__(self):
+        return len(self._records)
+
+    def lookup(self, digest):
+        with self._lock:
+            return self._records.get(digest)
+
+    def add(self, digest, name, reason):
+        with self._lock:
+            if digest in self._records:
+                return
+            record = {"digest": digest, "name": name, "reason": reason, "quarantined_at": time.time()}
+            self._records[digest] = record
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as quarantine_file:
+                    quarantine_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _with_digest(source, digest):
+    # Origem e hash do conteúdo; sem o hash, o arquivo é lido aqui para calculá-lo
+    if digest is None:
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as source_file:
+                source = source_file.read()
+        digest = content_digest(source)
+    return source, digest
+
+
+def _worker_main(connection, memory_mb, max_tasks):
+    # Processo filho: executa uma tarefa, (função, argumentos), por vez. Cada
+    # resposta informa se o processo vai terminar em seguida (após `max_tasks`
+    # tarefas ou acima do teto de memória), para que o processo principal o substitua.
+    if resource is not None and memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    # Avisar que o processo está pronto: o tempo limite de cada tarefa não
+    # inclui a inicialização do processo
+    connection.send(("ready", None, False))
+    for count in range(1, max_tasks + 1):
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        function, args = task
+        try:
+            status, payload = "ok", function(*args)
+        except MemoryError:
+            connection.send(("limit", f"teto de memória de {memory_mb} MB excedido", True))
+            return
+        except Exception as exc:
+            status, payload = "error", describe_error(exc)
+        retire = count == max_tasks or bool(memory_mb and peak_rss_mb() > memory_mb)
+        connection.send((status, payload, retire))
+        if retire:
+            return
+
+
+class _Worker:
+
+    def __init__(self, context, limits):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_connection, limits.memory_mb, limits.max_tasks),
+            name="nfce-isolated",
+            daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+        self.memory_mb = limits.memory_mb if resource is not None else None
+        self.ready = False
+        self.task = None
+        self.started = None
+
+    def submit(self, task):
+        self.connection.send((task.function, task.args))
+        self.task = task
+        self.started = time.monotonic()
+
+    def receive(self):
+        # (situação, conteúdo, encerrando) da mensagem recebida, ou None se não há nenhuma
+        if self.connection.poll():
+            try:
+                return self.connection.recv()
+            except (EOFError, OSError):
+                pass
+        elif self.process.is_alive():
+            return None
+        # A conexão fecha um pouco antes de o processo terminar: sem o join,
+        # o código de saída ainda seria None
+        self.process.join(EXIT_WAIT_SECONDS)
+        exitcode = self.process.exitcode
+        if exitcode and self.memory_mb:
+            # Sob o RLIMIT_AS, uma alocação que falha fora do tratamento do
+            # MemoryError (na biblioteca em C, ou ao montar a resposta)
+            # derruba o processo em vez de gerar a mensagem de limite
+            return "limit", f"teto de memória de {self.memory_mb} MB excedido (código {exitcode})", True
+        return "crash", f"o processo de extração terminou inesperadamente (código {exitcode})", True
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+class _IsolatedRunner:
+    # Executa as tarefas de iter_scheduled em processos próprios, uma por vez
+    # em cada um, sob os limites de `limits`
+
+    def __init__(self, max_workers, limits):
+        self.max_workers = max_workers
+        self.limits = limits
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = []
+        self.queued = deque()
+
+    def submit(self, task):
+        self.queued.append(task)
+
+    def _dispatch(self):
+        # Distribuir as tarefas aos processos livres, criando os que faltam;
+        # as de um documento que já terminou são descartadas
+        while self.queued and self.queued[0].stale:
+            self.queued.popleft()
+        for worker in list(self.workers):
+            if not self.queued:
+                break
+            if worker.ready and worker.task is None:
+                try:
+                    worker.submit(self.queued[0])
+                except OSError:
+                    # Processo encerrado enquanto estava livre: substituir
+                    worker.stop()
+                    self.workers.remove(worker)
+                    continue
+                self.queued.popleft()
+                while self.queued and self.queued[0].stale:
+                    self.queued.popleft()
+        while len(self.workers) < min(self.max_workers, len(self.queued) + sum(worker.task is not None for worker in self.workers)):
+            self.workers.append(_Worker(self.context, self.limits))
+
+    def wait(self):
+        timeout = self.limits.timeout
+        outcomes = []
+        while not outcomes:
+            self._dispatch()
+            active = [worker for worker in self.workers if worker.task is not None or not worker.ready]
+            if not active:
+                return outcomes
+            busy = [worker for worker in active if worker.task is not None]
+            deadline = min(worker.started for worker in busy) + timeout if busy and timeout else None
+            wait([worker.connection for worker in active] + [worker.process.sentinel for worker in active], max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+
+            for worker in active:
+                outcome = worker.receive()
+                if outcome is None and worker.task is not None and timeout and time.monotonic() - worker.started > timeout:
+                    outcome = "limit", f"tempo limite de {timeout:g} s excedido", True
+                if outcome is None:
+                    continue
+                status, payload, retire = outcome
+                if status == "ready":
+                    worker.ready = True
+                    continue
+                if worker.task is None:
+                    # O processo terminou antes de ficar pronto
+                    raise RuntimeError(f"Não foi possível iniciar o processo de extração: {payload}")
+                outcomes.append((worker.task, status, payload))
+                worker.task = None
+                if retire:
+                    worker.stop()
+                    self.workers.remove(worker)
+        return outcomes
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+def iter_extract_isolated(sources, max_workers=None, window=None, parser=None, backend=None, limits=None, quarantine=None, profiler=NULL_PROFILER):
+    # Como parallel.iter_extract (resultados na ordem de entrada, no máximo
+    # `window` arquivos em andamento, PDFs grandes divididos em blocos de
+    # páginas), mas cada processo executa uma tarefa por vez sob os limites
+    # de `limits`. Uma tarefa que passa do tempo limite tem o processo
+    # encerrado; uma que estoura o teto de memória ou derruba o processo é
+    # reportada como erro. Em todos esses casos o arquivo vai para a
+    # `quarantine` e o processo é substituído por um novo. As etapas medidas
+    # nos processos vão para `profiler`, como em iter_extract.
+    max_workers = max_workers or default_workers()
+    window = window or max_workers * 4
+    limits = limits or WorkerLimits()
+    quarantine = quarantine if quarantine is not None else Quarantine()
+
+    def documents():
+        # Os arquivos em quarentena nem chegam aos processos
+        for index, item in enumerate(sources):
+            name, source, digest = split_source(item)
+            source, digest = _with_digest(source, digest)
+            document = DocumentTasks(index, name, source, digest, parser, backend, profiler.enabled, max_workers)
+            record = quarantine.lookup(digest)
+            if record is not None:
+                document.stop(error=f"Arquivo em quarentena: {record['reason']}", quarantined=True)
+            yield document
+
+    runner = _IsolatedRunner(max_workers, limits)
+    try:
+        yield from iter_scheduled(documents(), runner, window, True, profiler, quarantine)
+    finally:
+        runner.close()
+
+
+class _CalibrationTask:
+    # Leitura de um PDF da amostra da calibração (measure_backends)
+    function = staticmethod(measure_backends)
+    stale = False
+
+    def __init__(self, source, parser):
+        self.args = (source, parser)
+
+
+def calibrate_isolated(samples, parser=None, limits=None, quarantine=None, max_samples=None):
+    # Como extractor.calibrate_backend, mas cada PDF da amostra, (nome,
+    # origem) ou (nome, origem, hash do conteúdo), é lido em um processo
+    # isolado, sob `limits`. Os arquivos em quarentena ficam fora da amostra,
+    # e os que passam de um limite vão para a `quarantine`.
+    limits = limits or WorkerLimits()
+    quarantine = quarantine if quarantine is not None else Quarantine()
+    if limits.timeout:
+        # Cada PDF é lido uma vez por leitor
+        limits = replace(limits, timeout=limits.timeout * len(PDF_BACKENDS))
+    runner = _IsolatedRunner(1, limits)
+    measurements = []
+    try:
+        for item in samples:
+            name, source, digest = split_source(item)
+            source, digest = _with_digest(source, digest)
+            if quarantine.lookup(digest) is not None:
+                continue
+            runner.submit(_CalibrationTask(source, parser))
+            for _, status, payload in runner.wait():
+                if status == "ok":
+                    measurements.append(payload)
+                elif status != "error":
+                    quarantine.add(digest, name, payload)
+            if max_samples and len(measurements) >= max_samples:
+                break
+    finally:
+        runner.close()
+    return summarize_calibration(measurements)
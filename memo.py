@@ -0,0 +1,39 @@
+import threading
+from collections import OrderedDict
+
+
+class LruMemo:
+    # Resultados recentes por chave, no máximo `size`: ao passar do limite,
+    # sai o usado há mais tempo. Seguro entre threads; um valor ausente é
+    # calculado fora da trava.
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def memoize(self, key, build):
+        # Valor guardado para `key` ou, na primeira vez, o resultado de build()
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from extractor import to_item_record
+from profiling import NULL_PROFILER
+from tasks import DocumentTasks, FileResult, describe_error, extract_task, iter_scheduled, set_error, set_result, split_source
+
+
+def default_workers():
+    return max(1, os.cpu_count() or 1)
+
+
+class _PoolRunner:
+    # Executa as tarefas de iter_scheduled no ProcessPoolExecutor
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.futures = {}
+
+    def submit(self, task):
+        self.futures[self.executor.submit(task.function, *task.args)] = task
+
+    def wait(self):
+        done, _ = wait(self.futures, return_when=FIRST_COMPLETED)
+        outcomes = []
+        for future in done:
+            task = self.futures.pop(future)
+            try:
+                outcomes.append((task, "ok", future.result()))
+            except Exception as exc:
+                outcomes.append((task, "error", describe_error(exc)))
+        return outcomes
+
+
+def iter_extract(sources, max_workers=None, window=None, parser=None, backend=None, ordered=True, profiler=NULL_PROFILER):
+    # Extração em fluxo de um lote: sources é um iterável de (nome, caminho ou
+    # bytes), opcionalmente com o hash do conteúdo (dedup.content_digest) como
+    # terceiro elemento, e os resultados saem na ordem de entrada (ou, com ordered=False,
+    # à medida que cada arquivo termina), com no máximo `window` arquivos em
+    # andamento ao mesmo tempo. Os PDFs grandes são divididos em blocos de
+    # páginas entre os processos (ver tasks.DocumentTasks). As etapas medidas
+    # nos processos filhos vão para `profiler`, marcadas com o nome do arquivo.
+    max_workers = max_workers or default_workers()
+    window = window or max_workers * 4
+
+    if max_workers == 1:
+        for index, item in enumerate(sources):
+            name, source, digest = split_source(item)
+            result = FileResult(index=index, name=name)
+            try:
+                set_result(result, extract_task(source, parser, backend, profiler.enabled, digest), profiler)
+            except Exception as exc:
+                set_error(result, exc)
+            yield result
+        return
+
+    # "spawn" evita herdar por fork as threads do servidor do Streamlit
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        documents = (DocumentTasks(index, *split_source(item), parser=parser, backend=backend, profile=profiler.enabled, workers=max_workers) for index, item in enumerate(sources))
+        yield from iter_scheduled(documents, _PoolRunner(executor), window, ordered, profiler)
+
+
+def iter_items_many(sources, max_workers=None, window=None, parser=None, backend=None, errors=None):
+    # Itens de muitos documentos: (nome do arquivo, ItemRecord), arquivo por
+    # arquivo na ordem em que cada um termina. Os arquivos com erro não geram
+    # itens e, se `errors` for uma lista, são acrescentados a ela (FileResult).
+    for result in iter_extract(sources, max_workers, window, parser, backend, ordered=False):
+        if result.error is not None:
+            if errors is not None:
+                errors.append(result)
+            continue
+        for row in result.data:
+            yield result.name, to_item_record(row)
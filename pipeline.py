@@ -0,0 +1,173 @@
+import itertools
+import queue
+import threading
+
+from cache import content_key
+from extractor import cache_version, calibrate_backend, is_xml_document
+from isolation import calibrate_isolated, iter_extract_isolated
+from parallel import default_workers, iter_extract
+from profiling import NULL_PROFILER
+
+# Resultados prontos e ainda não consumidos pela interface, por processo
+RESULT_QUEUE_FACTOR = 2
+
+# Calibração dos leitores de PDF: PDFs lidos com todos os leitores e PDFs
+# examinados, no máximo, em busca de amostras que o PyPDF2 consiga ler
+CALIBRATION_SAMPLES = 3
+CALIBRATION_CANDIDATES = 10
+
+
+class ExtractionJob:
+    # Extração de um lote em segundo plano. Uma thread consulta o cache e
+    # alimenta o pool de processos com no máximo `window` arquivos em
+    # andamento; cada resultado vai para uma fila limitada, consumida pelo
+    # script do Streamlit a cada reexecução. Com a fila cheia a thread espera,
+    # então nem os PDFs enviados ao pool nem os resultados pendentes crescem
+    # com o tamanho do lote.
+
+    def __init__(self, pending, cache, max_workers=None, window=None, parser=None, profiler=NULL_PROFILER, backend=None, limits=None, quarantine=None, calibration=None):
+        # pending: lista de (chave, arquivo enviado, hash do conteúdo), como
+        # em BatchSession.start. Com `limits` (WorkerLimits),
+        # a extração usa o modo isolado, com tempo limite e quarentena. Com
+        # `calibration` (dicionário compartilhado entre os jobs), o leitor de
+        # PDF é escolhido por calibrate_backend na thread do job, uma única
+        # vez; no modo isolado, sob os mesmos limites.
+        self.max_workers = max_workers or default_workers()
+        self.window = window or self.max_workers * 2
+        self.error = None
+        self._pending = pending
+        self._cache = cache
+        self._parser = parser
+        self._backend = backend
+        self._limits = limits
+        self._quarantine = quarantine
+        self._calibration = calibration
+        self._profiler = profiler
+        # PDFs rejeitados pela triagem e tempo poupado, ainda não consumidos por pop_screening()
+        self._screening = [0, 0.0]
+        self._screening_lock = threading.Lock()
+        self._results = queue.Queue(maxsize=self.max_workers * RESULT_QUEUE_FACTOR)
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="nfce-extraction", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def done(self):
+        # Terminado e com todos os resultados já consumidos
+        return self._finished.is_set() and self._results.empty()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        # Os arquivos ainda não enviados ao pool são descartados; os que já
+        # estão em andamento terminam, mas seus resultados não são publicados
+        self._cancelled.set()
+
+    def poll(self):
+        # Resultados prontos desde a última chamada: lista de
+        # (chave, (dados, valor total, identificação, erro))
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                break
+        return results
+
+    def pop_screening(self):
+        # (arquivos rejeitados, segundos poupados) desde a última chamada
+        with self._screening_lock:
+            screening = tuple(self._screening)
+            self._screening = [0, 0.0]
+        return screening
+
+    def _publish(self, key, result):
+        while not self._cancelled.is_set():
+            try:
+                self._results.put((key, result), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _choose_backend(self):
+        # Leitor do lote: o informado ou o escolhido pela calibração
+        if self._calibration is None:
+            return self._backend
+        result = self._calibration.get("result")
+        if result is None:
+            # Os XMLs não passam pelo leitor, e os arquivos em quarentena não são lidos de novo
+            quarantine = self._quarantine
+            candidates = itertools.islice(
+                ((uploaded_file, digest) for _, uploaded_file, digest in self._pending if not is_xml_document(uploaded_file) and (quarantine is None or quarantine.lookup(digest) is None)),
+                CALIBRATION_CANDIDATES,
+            )
+            with self._profiler.stage("backend_calibration"):
+                if self._limits is not None:
+                    samples = ((uploaded_file.name, uploaded_file.getvalue(), digest) for uploaded_file, digest in candidates)
+                    result = calibrate_isolated(samples, self._parser, self._limits, quarantine, CALIBRATION_SAMPLES)
+                else:
+                    result = calibrate_backend((uploaded_file.getvalue() for uploaded_file, _ in candidates), self._parser, max_samples=CALIBRATION_SAMPLES)
+            # Sem nenhum PDF legível, o lote usa o leitor de referência e a
+            # calibração é tentada de novo no próximo lote
+            if result is None:
+                return None
+            self._calibration["result"] = result
+        return result.backend
+
+    def _run(self):
+        try:
+            backend = self._choose_backend()
+            misses = []
+            for key, uploaded_file, digest in self._pending:
+                if self._cancelled.is_set():
+                    return
+                with self._profiler.stage("cache_lookup", file=uploaded_file.name) as event:
+                    cache_key = content_key(digest, cache_version(self._parser, backend))
+                    cached = self._cache.get(cache_key)
+                    event["hit"] = cached is not None
+                if cached is not None:
+                    if not self._publish(key, (*cached, None)):
+                        return
+                else:
+                    misses.append((key, cache_key, uploaded_file, digest))
+
+            def sources():
+                # Cada upload só é copiado quando entra na janela de extração;
+                # o hash calculado por BatchSession.start segue junto
+                for _, _, uploaded_file, digest in misses:
+                    with self._profiler.stage("read_upload", file=uploaded_file.name) as event:
+                        pdf_bytes = uploaded_file.getvalue()
+                        event["bytes"] = len(pdf_bytes)
+                    yield uploaded_file.name, pdf_bytes, digest
+
+            if self._limits is not None:
+                results = iter_extract_isolated(sources(), self.max_workers, self.window, self._parser, backend, self._limits, self._quarantine, self._profiler)
+            else:
+                results = iter_extract(sources(), max_workers=self.max_workers, window=self.window, parser=self._parser, backend=backend, profiler=self._profiler)
+            try:
+                for (key, cache_key, _, _), file_result in zip(misses, results):
+                    if file_result.error is None:
+                        self._cache.put(cache_key, (file_result.data, file_result.total_value, file_result.header))
+                        result = (file_result.data, file_result.total_value, file_result.header, None)
+                    else:
+                        result = ([], 0, None, file_result.error)
+                        if file_result.rejected:
+                            with self._screening_lock:
+                                self._screening[0] += 1
+                                self._screening[1] += file_result.saved_seconds
+                    if not self._publish(key, result):
+                        return
+            finally:
+                # Encerrar o pool mesmo em caso de cancelamento
+                results.close()
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+        finally:
+            self._finished.set()
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    # Pico de memória residente de todo o processo desde o início, não de uma
+    # operação específica (ru_maxrss é em KiB no Linux); NaN sem o resource
+    if resource is None:
+        return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _Stage:
+    # Contexto que mede uma etapa; os campos extras (bytes, rows...) podem ser
+    # preenchidos dentro do bloco através do dicionário retornado
+    __slots__ = ("profiler", "event", "started")
+
+    def __init__(self, profiler, event):
+        self.profiler = profiler
+        self.event = event
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self.event
+
+    def __exit__(self, exc_type, exc, traceback):
+        finished = time.perf_counter_ns()
+        self.event["start_ns"] = self.started
+        self.event["duration_ns"] = finished - self.started
+        if exc_type is not None:
+            self.event["error"] = exc_type.__name__
+        self.profiler.add(self.event)
+        return False
+
+
+class _NullStage:
+    # Contexto vazio e reutilizável: com a instrumentação desligada cada etapa
+    # custa apenas uma chamada de método, sem alocar nada
+    __slots__ = ("event",)
+
+    def __init__(self):
+        self.event = {}
+
+    def __enter__(self):
+        return self.event
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+class NullProfiler:
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name, **fields):
+        return self._stage
+
+    def add(self, event):
+        pass
+
+    def extend(self, events, **fields):
+        pass
+
+    def clear(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    # Coleta a duração de cada etapa do pipeline, com contagens de bytes e de
+    # linhas, por arquivo e por página
+    enabled = True
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def stage(self, name, **fields):
+        event = {"name": name, "pid": os.getpid(), "tid": threading.get_ident()}
+        event.update(fields)
+        return _Stage(self, event)
+
+    def add(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def extend(self, events, **fields):
+        # Incorporar eventos coletados em outro processo, marcando-os com os
+        # campos informados (por exemplo, o nome do arquivo)
+        with self._lock:
+            for event in events:
+                event.update(fields)
+                self.events.append(event)
+
+    def snapshot(self):
+        # Cópia dos eventos: a extração em segundo plano continua acrescentando
+        # eventos enquanto a interface os exibe
+        with self._lock:
+            return list(self.events)
+
+    def clear(self):
+        with self._lock:
+            self.events = []
+
+    def summary(self):
+        # Totais por etapa: chamadas, tempo total/médio/máximo, bytes e linhas
+        stages = defaultdict(lambda: {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "bytes": 0, "rows": 0})
+        for event in self.snapshot():
+            stage = stages[event["name"]]
+            duration_ms = event["duration_ns"] / 1e6
+            stage["calls"] += 1
+            stage["total_ms"] += duration_ms
+            stage["max_ms"] = max(stage["max_ms"], duration_ms)
+            stage["bytes"] += event.get("bytes", 0)
+            stage["rows"] += event.get("rows", 0)
+        rows = []
+        for name, stage in stages.items():
+            stage["mean_ms"] = stage["total_ms"] / stage["calls"]
+            rows.append({"stage": name, **stage})
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+    def by_file(self):
+        files = defaultdict(lambda: defaultdict(float))
+        for event in self.snapshot():
+            if "file" in event:
+                files[event["file"]][event["name"]] += event["duration_ns"] / 1e6
+        return {name: dict(stages) for name, stages in files.items()}
+
+    def to_json(self):
+        return json.dumps({"summary": self.summary(), "events": self.snapshot()}, ensure_ascii=False, indent=2)
+
+    def to_chrome_trace(self):
+        # Formato "Trace Event" (chrome://tracing, Perfetto): eventos completos ("X")
+        # com tempos em microssegundos
+        events = self.snapshot()
+        origin = min((event["start_ns"] for event in events), default=0)
+        trace_events = []
+        for event in events:
+            args = {key: value for key, value in event.items() if key not in ("name", "pid", "tid", "start_ns", "duration_ns")}
+            trace_events.append({
+                "name": event["name"],
+                "cat": "extração",
+                "ph": "X",
+                "ts": (event["start_ns"] - origin) / 1000,
+                "dur": event["duration_ns"] / 1000,
+                "pid": event["pid"],
+                "tid": event["tid"],
+                "args": args,
+            })
+        return json.dumps({"traceEvents": trace_events, "displayTimeUnit": "ms"}, ensure_ascii=False)
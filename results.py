@@ -0,0 +1,272 @@
+import os
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from extractor import COLUMNS
+
+NUMERIC_COLUMNS = ["Qtde.", "Vl. unid.", "Vl. total"]
+CATEGORY_COLUMNS = ["Descrição", "Unid."]
+FILE_ID_COLUMN = "PDF"
+
+# Buffers das colunas: o número do item é guardado como int32 mais uma
+# máscara de ausentes, e as colunas categóricas como códigos int32
+BUFFER_DTYPES = {
+    FILE_ID_COLUMN: "int32",
+    "Item": "int32",
+    "Item_ausente": "bool",
+    "Descrição": "int32",
+    "Qtde.": "float64",
+    "Unid.": "int32",
+    "Vl. unid.": "float64",
+    "Vl. total": "float64",
+}
+ROW_BYTES = sum(np.dtype(dtype).itemsize for dtype in BUFFER_DTYPES.values())
+INITIAL_CAPACITY = 1024
+
+
+def parse_brl_numbers(values):
+    # Converter textos no formato brasileiro ("1.234,56") em float64.
+    # Quando não há vírgula, o ponto é tratado como separador decimal,
+    # como fazia o float(vl.replace(',', '.')) original. Inválidos viram NaN.
+    text = pd.Series(values, dtype="object").astype("string")
+    has_comma = text.str.contains(",", regex=False).fillna(False)
+    brazilian = text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    normalized = brazilian.where(has_comma, text)
+    return pd.to_numeric(normalized, errors="coerce").astype("float64").to_numpy()
+
+
+class ItemTable:
+    # Tabela consolidada de itens de um lote: uma linha por item, colunas
+    # tipadas e uma coluna "PDF" com o índice do arquivo de origem. As linhas
+    # de cada arquivo ficam contíguas, delimitadas por `offsets`.
+    #
+    # As linhas são acrescentadas em buffers colunares pré-alocados, que
+    # dobram de capacidade quando enchem; o DataFrame exposto em `frame` é
+    # apenas uma visão desses buffers. Acima de `memory_limit` bytes os
+    # buffers passam para arquivos mapeados em memória em `spill_dir` (ou em
+    # um diretório temporário). Os totais por arquivo e por produto/unidade
+    # são atualizados a cada acréscimo, sem percorrer a tabela inteira.
+
+    def __init__(self, memory_limit=None, spill_dir=None, capacity=INITIAL_CAPACITY):
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self.file_names = []
+        self.length = 0
+        self.capacity = 0
+        self.token = uuid.uuid4().hex
+        self.version = 0
+        self._offsets = [0]
+        self._file_totals = []
+        self._buffers = {}
+        self._spill = None
+        self._spill_generation = 0
+        self._codes = {column: {} for column in CATEGORY_COLUMNS}
+        self._categories = {column: [] for column in CATEGORY_COLUMNS}
+        # Somas por código de categoria: gasto, quantidade e número de itens
+        self._category_sums = {column: np.zeros((3, 0)) for column in CATEGORY_COLUMNS}
+        self._frame = None
+        self._allocate(capacity)
+
+    @property
+    def file_count(self):
+        return len(self.file_names)
+
+    @property
+    def offsets(self):
+        return np.asarray(self._offsets, dtype="int64")
+
+    @property
+    def spilled(self):
+        return self._spill is not None
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = self._view(0, self.length)
+        return self._frame
+
+    @property
+    def item_count(self):
+        return self.length
+
+    @property
+    def total_sum(self):
+        return float(sum(self._file_totals))
+
+    def file_frame(self, file_id):
+        start, end = self._offsets[file_id], self._offsets[file_id + 1]
+        return self._view(start, end).drop(columns=FILE_ID_COLUMN)
+
+    def file_totals(self):
+        # Soma de "Vl. total" por arquivo, incluindo arquivos sem itens
+        return np.asarray(self._file_totals, dtype="float64")
+
+    def memory_usage(self):
+        # Bytes em memória; buffers despejados em disco não contam
+        if self.spilled:
+            return 0
+        return self.capacity * ROW_BYTES
+
+    def category_totals(self, column):
+        # (categorias, gasto, quantidade, itens) das categorias com itens
+        sums = self._category_sums[column]
+        present = np.flatnonzero(sums[2])
+        categories = np.asarray(self._categories[column], dtype="object")[present]
+        return categories, sums[0, present], sums[1, present], sums[2, present].astype("int64")
+
+    def append_files(self, file_rows):
+        # file_rows: iterável de (nome do arquivo, linhas extraídas). As colunas
+        # são acumuladas em listas simples e convertidas uma única vez por
+        # chamada; retorna o total de cada arquivo acrescentado.
+        names = []
+        counts = []
+        columns = [[] for _ in COLUMNS]
+        for name, rows in file_rows:
+            names.append(name)
+            counts.append(len(rows))
+            for row in rows:
+                for column, value in zip(columns, row):
+                    column.append(value)
+
+        values = dict(zip(COLUMNS, columns))
+        item = pd.to_numeric(pd.Series(values["Item"], dtype="object"), errors="coerce").to_numpy(dtype="float64")
+        chunk = {
+            "Item": np.nan_to_num(item).astype("int32"),
+            "Item_ausente": np.isnan(item),
+            "Qtde.": parse_brl_numbers(values["Qtde."]),
+            "Vl. unid.": parse_brl_numbers(values["Vl. unid."]),
+            "Vl. total": parse_brl_numbers(values["Vl. total"]),
+        }
+        for column in CATEGORY_COLUMNS:
+            chunk[column] = self._encode(column, values[column])
+        return self._append_chunk(chunk, names, counts)
+
+    def drop_files(self, file_ids):
+        # Nova tabela sem os arquivos informados, com os índices renumerados
+        removed = np.zeros(self.file_count, dtype=bool)
+        removed[list(file_ids)] = True
+        file_column = self._buffers[FILE_ID_COLUMN][:self.length]
+        keep = ~removed[file_column]
+
+        table = ItemTable(self.memory_limit, self.spill_dir, capacity=max(INITIAL_CAPACITY, int(keep.sum())))
+        table._codes = {column: dict(codes) for column, codes in self._codes.items()}
+        table._categories = {column: list(categories) for column, categories in self._categories.items()}
+        table._category_sums = {column: np.zeros((3, len(categories))) for column, categories in table._categories.items()}
+        chunk = {column: self._buffers[column][:self.length][keep] for column in BUFFER_DTYPES if column != FILE_ID_COLUMN}
+        counts = np.diff(self._offsets)[~removed]
+        table._append_chunk(chunk, [name for name, drop in zip(self.file_names, removed) if not drop], counts)
+        self.close()
+        return table
+
+    def close(self):
+        # Liberar os arquivos de despejo, se houver
+        if self._spill is not None:
+            self._buffers = {}
+            self._frame = None
+            self._spill.cleanup()
+            self._spill = None
+
+    def _encode(self, column, values):
+        # Códigos das categorias, criando as novas; -1 para ausentes
+        local = pd.Categorical(values)
+        mapping = np.asarray([self._code(column, value) for value in local.categories], dtype="int32")
+        return np.where(local.codes >= 0, mapping[local.codes] if len(mapping) else -1, -1).astype("int32")
+
+    def _code(self, column, value):
+        codes = self._codes[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self._categories[column])
+            self._categories[column].append(value)
+        return code
+
+    def _append_chunk(self, chunk, names, counts):
+        rows = int(np.sum(counts)) if len(counts) else 0
+        if self.length + rows > self.capacity:
+            capacity = self.capacity
+            while capacity < self.length + rows:
+                capacity *= 2
+            self._allocate(capacity)
+
+        first_id = self.file_count
+        file_ids = np.repeat(np.arange(first_id, first_id + len(names), dtype="int32"), np.asarray(counts, dtype="int64"))
+        start, end = self.length, self.length + rows
+        self._buffers[FILE_ID_COLUMN][start:end] = file_ids
+        for column, values in chunk.items():
+            self._buffers[column][start:end] = values
+
+        # Totais por arquivo e por categoria, só com as linhas novas
+        totals = np.nan_to_num(chunk["Vl. total"])
+        file_totals = np.zeros(len(names), dtype="float64")
+        np.add.at(file_totals, file_ids - first_id, totals)
+        quantities = np.nan_to_num(chunk["Qtde."])
+        for column in CATEGORY_COLUMNS:
+            sums = self._category_sums[column]
+            if sums.shape[1] < len(self._categories[column]):
+                sums = self._category_sums[column] = np.pad(sums, ((0, 0), (0, len(self._categories[column]) - sums.shape[1])))
+            codes = chunk[column]
+            present = codes >= 0
+            np.add.at(sums[0], codes[present], totals[present])
+            np.add.at(sums[1], codes[present], quantities[present])
+            np.add.at(sums[2], codes[present], 1)
+
+        self.file_names.extend(names)
+        self._offsets.extend((self.length + np.cumsum(counts)).tolist() if len(counts) else [])
+        self._file_totals.extend(file_totals.tolist())
+        self.length = end
+        self.version += 1
+        self._frame = None
+        return file_totals.tolist()
+
+    def _allocate(self, capacity):
+        # Novos buffers com a capacidade pedida, copiando as linhas existentes
+        spill = self.memory_limit is not None and capacity * ROW_BYTES > self.memory_limit
+        if spill and self._spill is None:
+            self._spill = tempfile.TemporaryDirectory(prefix="nfce-itens-", dir=self.spill_dir, ignore_cleanup_errors=True)
+        self._spill_generation += 1
+        old_paths = [buffer.filename for buffer in self._buffers.values() if isinstance(buffer, np.memmap)]
+        buffers = {}
+        for position, (column, dtype) in enumerate(BUFFER_DTYPES.items()):
+            if spill:
+                path = os.path.join(self._spill.name, f"{self._spill_generation}-{position}.bin")
+                buffer = np.memmap(path, dtype=dtype, mode="w+", shape=(capacity,))
+            else:
+                buffer = np.empty(capacity, dtype=dtype)
+            if self.length:
+                buffer[:self.length] = self._buffers[column][:self.length]
+            buffers[column] = buffer
+        self._buffers = buffers
+        self.capacity = capacity
+        self._frame = None
+        for path in old_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _view(self, start, end):
+        buffers = self._buffers
+        item = pd.arrays.IntegerArray(buffers["Item"][start:end], buffers["Item_ausente"][start:end])
+        return pd.DataFrame({
+            FILE_ID_COLUMN: buffers[FILE_ID_COLUMN][start:end],
+            "Item": item,
+            "Descrição": pd.Categorical.from_codes(buffers["Descrição"][start:end], categories=self._category_index("Descrição")),
+            "Qtde.": buffers["Qtde."][start:end],
+            "Unid.": pd.Categorical.from_codes(buffers["Unid."][start:end], categories=self._category_index("Unid.")),
+            "Vl. unid.": buffers["Vl. unid."][start:end],
+            "Vl. total": buffers["Vl. total"][start:end],
+        }, copy=False)
+
+    def _category_index(self, column):
+        return pd.Index(self._categories[column], dtype="object")
+
+
+def build_item_table(file_rows, memory_limit=None, spill_dir=None):
+    # file_rows: iterável de (nome do arquivo, linhas extraídas)
+    table = ItemTable(memory_limit, spill_dir)
+    table.append_files(file_rows)
+    return table
+
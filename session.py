@@ -0,0 +1,239 @@
+import uuid
+from dataclasses import dataclass
+
+from dedup import content_digest
+from results import build_item_table
+
+
+def file_identity(uploaded_file, occurrence=0):
+    # O Streamlit atribui um file_id a cada upload; sem ele, usar nome e tamanho
+    file_id = getattr(uploaded_file, "file_id", None)
+    if file_id:
+        return file_id
+    size = getattr(uploaded_file, "size", None)
+    return f"{uploaded_file.name}:{size}:{occurrence}"
+
+
+def upload_keys(uploaded_files):
+    # Chave de cada arquivo enviado, distinguindo envios repetidos do mesmo arquivo
+    keys = []
+    seen = {}
+    for uploaded_file in uploaded_files:
+        base = file_identity(uploaded_file)
+        occurrence = seen.get(base, 0)
+        seen[base] = occurrence + 1
+        keys.append(base if occurrence == 0 else file_identity(uploaded_file, occurrence))
+    return keys
+
+
+@dataclass
+class FileEntry:
+    name: str
+    data: list
+    total_value: float
+    error: str = None
+    digest: str = None
+    header: dict = None
+    # Chave do arquivo do lote com a mesma NFC-e, ou nome do arquivo de uma
+    # sessão anterior; os itens de uma duplicata não entram nos totais
+    duplicate_of: str = None
+    seen_before: bool = False
+    # Ainda aguardando a extração (ou a do arquivo de mesmo conteúdo `copy_of`)
+    pending: bool = False
+    copy_of: str = None
+    extracted: bool = False
+
+    @property
+    def counted_data(self):
+        return [] if self.duplicate_of is not None else self.data
+
+
+@dataclass
+class SyncReport:
+    added: int
+    removed: int
+    reused: int
+    skipped: int = 0
+
+
+class BatchSession:
+    # Estado incremental de um lote de uploads, guardado em st.session_state.
+    # Cada arquivo é extraído uma única vez; ao adicionar ou remover arquivos,
+    # a tabela consolidada e os totais são atualizados só pela diferença.
+
+    def __init__(self, memory_limit=None, spill_dir=None):
+        self.session_id = uuid.uuid4().hex
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self.entries = {}
+        self.order = []
+        self.target = []
+        self.table = build_item_table([], memory_limit, spill_dir)
+        self.file_totals = []
+        self.total_sum = 0.0
+        self.report = None
+        self._document_index = None
+        self._skip_known = False
+
+    def start(self, uploaded_files, document_index=None, skip_known=False):
+        # Atualizar o lote para a nova lista de uploads e devolver, com o
+        # relatório, os (chave, arquivo, hash do conteúdo) que precisam ser
+        # extraídos. Arquivos
+        # com o mesmo conteúdo de outro do lote (ou, com skip_known, de uma
+        # sessão anterior registrada em `document_index`) não são extraídos.
+        self._document_index = document_index
+        self._skip_known = skip_known
+        keys = upload_keys(uploaded_files)
+
+        current = set(keys)
+        removed = [index for index, key in enumerate(self.order) if key not in current]
+        for key in [key for key, entry in self.entries.items() if entry.pending and key not in current]:
+            del self.entries[key]
+        added = [(key, uploaded_file) for key, uploaded_file in zip(keys, uploaded_files) if key not in self.entries or self.entries[key].pending]
+
+        skipped = 0
+        pending = []
+        if added:
+            digests = {entry.digest: key for key, entry in self.entries.items() if not entry.pending}
+            for key, uploaded_file in added:
+                entry = FileEntry(name=uploaded_file.name, data=[], total_value=0, digest=content_digest(uploaded_file.getvalue()), pending=True)
+                self.entries[key] = entry
+                known = document_index.lookup(digest=entry.digest, exclude_owner=self.session_id) if skip_known and document_index is not None else None
+                if entry.digest in digests:
+                    # Mesmo conteúdo de um arquivo do lote: reaproveitar o resultado dele
+                    entry.copy_of = digests[entry.digest]
+                    self._copy_result(entry)
+                    skipped += 1
+                elif known is not None:
+                    entry.duplicate_of = known["name"]
+                    entry.seen_before = True
+                    entry.pending = False
+                    skipped += 1
+                else:
+                    digests[entry.digest] = key
+                    pending.append((key, uploaded_file, entry.digest))
+
+        if removed:
+            self.table = self.table.drop_files(removed)
+            for index in reversed(removed):
+                self.total_sum -= self.file_totals.pop(index)
+                del self.entries[self.order.pop(index)]
+            # Sem o arquivo original, a primeira duplicata restante passa a contar
+            if self._assign_duplicates(self.order):
+                self._rebuild(self.order)
+
+        self.target = keys
+        self._advance()
+        self.report = SyncReport(added=len(added), removed=len(removed), reused=len(keys) - len(added), skipped=skipped)
+        return self.report, pending
+
+    def complete(self, results):
+        # Incorporar resultados de extração, (chave, (dados, valor total,
+        # identificação, erro)), em qualquer ordem. Os arquivos entram na
+        # tabela na ordem de envio, assim que os anteriores estiverem prontos.
+        # Retorna as chaves extraídas que passaram a contar nos totais.
+        document_index = self._document_index
+        for key, (data, total_value, header, error) in results:
+            entry = self.entries.get(key)
+            if entry is None or not entry.pending:
+                continue
+            entry.data, entry.total_value, entry.header, entry.error = data, total_value, header, error
+            entry.pending = False
+            entry.extracted = True
+            if error is not None or document_index is None:
+                continue
+            access_key = (header or {}).get("access_key")
+            known = document_index.lookup(access_key=access_key, exclude_owner=self.session_id) if self._skip_known and access_key else None
+            if known is not None:
+                entry.duplicate_of = known["name"]
+                entry.seen_before = True
+            else:
+                document_index.add(entry.digest, header, entry.name, self.session_id)
+
+        appended = self._advance()
+        return [key for key in appended if self.entries[key].extracted and self.entries[key].duplicate_of is None and self.entries[key].error is None]
+
+    @property
+    def pending_count(self):
+        return sum(entry.pending for entry in self.entries.values())
+
+    def _copy_result(self, entry):
+        original = self.entries[entry.copy_of]
+        if not original.pending:
+            entry.data, entry.total_value, entry.header, entry.error = original.data, original.total_value, original.header, original.error
+            entry.pending = False
+
+    def _advance(self):
+        # Acrescentar à tabela os arquivos prontos, na ordem de envio; com
+        # tudo pronto e a ordem diferente da dos uploads, remontar a tabela.
+        # Retorna as chaves que entraram na tabela.
+        for entry in self.entries.values():
+            if entry.pending and entry.copy_of is not None:
+                self._copy_result(entry)
+
+        in_order = set(self.order)
+        new_keys = []
+        for key in self.target:
+            if key in in_order:
+                continue
+            if self.entries[key].pending:
+                break
+            new_keys.append(key)
+
+        if new_keys:
+            self._assign_duplicates(self.order + new_keys)
+            added_totals = self.table.append_files((self.entries[key].name, self.entries[key].counted_data) for key in new_keys)
+            self.order.extend(new_keys)
+            self.file_totals.extend(added_totals)
+            self.total_sum += sum(added_totals)
+
+        if self.order != self.target and not self.pending_count:
+            # A ordem dos uploads mudou: remontar a tabela, sem extrair de novo
+            appended = [key for key in self.target if key not in in_order]
+            self._assign_duplicates(self.target)
+            self._rebuild(self.target)
+            return appended
+        return new_keys
+
+    def duplicates(self):
+        return sum(self.entries[key].duplicate_of is not None for key in self.order)
+
+    def _assign_duplicates(self, keys):
+        # A primeira ocorrência de cada NFC-e (pelo conteúdo ou pela chave de
+        # acesso) conta nos totais; as demais apontam para ela. Retorna se
+        # algum dos arquivos já existentes mudou de situação.
+        owners = {}
+        changed = False
+        for key in keys:
+            entry = self.entries[key]
+            if entry.seen_before:
+                continue
+            access_key = (entry.header or {}).get("access_key")
+            duplicate_of = owners.get(entry.digest) or (owners.get(access_key) if access_key else None)
+            if duplicate_of is None:
+                owners[entry.digest] = key
+                if access_key:
+                    owners[access_key] = key
+            if entry.duplicate_of != duplicate_of:
+                changed = changed or key in self.order
+                entry.duplicate_of = duplicate_of
+        return changed
+
+    def counted_positions(self):
+        # Posições, na tabela, dos arquivos que contam nos totais: sem as
+        # duplicatas e os arquivos com erro (ou rejeitados pela triagem)
+        return [idx for idx, key in enumerate(self.order) if self.entries[key].duplicate_of is None and self.entries[key].error is None]
+
+    def errors(self):
+        return [(entry.name, entry.error) for entry in (self.entries[key] for key in self.order) if entry.error is not None]
+
+    def clear(self):
+        self.table.close()
+        self.__init__(self.memory_limit, self.spill_dir)
+
+    def _rebuild(self, keys):
+        self.order = list(keys)
+        self.table.close()
+        self.table = build_item_table(((self.entries[key].name, self.entries[key].counted_data) for key in self.order), self.memory_limit, self.spill_dir)
+        self.file_totals = self.table.file_totals().tolist()
+        self.total_sum = sum(self.file_totals)
@@ -0,0 +1,88 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from memo import LruMemo
+
+TOP_PRODUCTS = 20
+
+# Resultados recentes, indexados pela impressão digital do conjunto de dados
+_MEMO = LruMemo(16)
+
+
+@dataclass
+class BatchStatistics:
+    file_count: int
+    item_count: int
+    total_sum: float
+    mean_total: float
+    min_total: float
+    max_total: float
+    per_file: pd.DataFrame
+    top_products: pd.DataFrame
+    unit_prices: pd.DataFrame
+    quantity_by_unit: pd.DataFrame
+
+
+def dataset_fingerprint(table):
+    # A tabela muda apenas por acréscimos, que incrementam sua versão: o par
+    # (identificador, versão) distingue os conteúdos sem percorrer as linhas
+    return f"{table.token}:{table.version}"
+
+
+def compute_statistics(table, top_products=TOP_PRODUCTS, files=None):
+    # files: posições, na tabela, dos arquivos que contam nas estatísticas por
+    # arquivo (sem duplicatas nem arquivos com erro, que ficam na tabela sem
+    # linhas); None para todos
+    frame = table.frame
+    positions = np.arange(table.file_count) if files is None else np.asarray(files, dtype="int64")
+    totals = table.file_totals()[positions]
+    total_sum = float(totals.sum())
+    file_count = len(positions)
+
+    per_file = pd.DataFrame({
+        "PDF": [f"PDF {i+1}" for i in positions],
+        "Arquivo": [table.file_names[i] for i in positions],
+        "Valor Total (R$)": totals,
+        "Contribuição (%)": totals / total_sum * 100 if total_sum else np.zeros(file_count),
+    })
+
+    # Gasto, quantidade e itens por descrição e por unidade já são mantidos
+    # pela tabela a cada acréscimo; só a distribuição de preços unitários
+    # (mediana) precisa percorrer as linhas
+    descriptions, spent, quantity, occurrences = table.category_totals("Descrição")
+    by_description = pd.DataFrame({"Descrição": descriptions, "Gasto (R$)": spent, "Qtde. total": quantity, "Ocorrências": occurrences})
+    top = by_description.nlargest(top_products, "Gasto (R$)").reset_index(drop=True)
+
+    unit_prices = frame.groupby("Descrição", observed=True, sort=False).agg(
+        ocorrencias=("Vl. total", "size"),
+        preco_min=("Vl. unid.", "min"),
+        preco_mediano=("Vl. unid.", "median"),
+        preco_medio=("Vl. unid.", "mean"),
+        preco_max=("Vl. unid.", "max"),
+    ).sort_values("ocorrencias", ascending=False).reset_index()
+    unit_prices.columns = ["Descrição", "Ocorrências", "Vl. unid. mín.", "Vl. unid. mediano", "Vl. unid. médio", "Vl. unid. máx."]
+
+    units, spent, quantity, items = table.category_totals("Unid.")
+    quantity_by_unit = pd.DataFrame({"Unid.": units, "Qtde. total": quantity, "Itens": items, "Gasto (R$)": spent}).sort_values("Unid.").reset_index(drop=True)
+
+    return BatchStatistics(
+        file_count=file_count,
+        item_count=table.item_count,
+        total_sum=total_sum,
+        mean_total=float(totals.mean()) if file_count else 0.0,
+        min_total=float(totals.min()) if file_count else 0.0,
+        max_total=float(totals.max()) if file_count else 0.0,
+        per_file=per_file,
+        top_products=top,
+        unit_prices=unit_prices,
+        quantity_by_unit=quantity_by_unit,
+    )
+
+
+def get_statistics(table, top_products=TOP_PRODUCTS, files=None):
+    # Versão memoizada de compute_statistics: reexecuções com os mesmos
+    # dados reaproveitam o resultado anterior
+    key = (dataset_fingerprint(table), top_products, None if files is None else tuple(files))
+    return _MEMO.memoize(key, lambda: compute_statistics(table, top_products, files))
@@ -0,0 +1,239 @@
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from memo import LruMemo
+from stats import TOP_PRODUCTS, BatchStatistics
+
+# Documentos gravados por transação
+INSERT_BATCH_DOCUMENTS = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL UNIQUE,
+    access_key TEXT UNIQUE,
+    file_name TEXT NOT NULL,
+    number INTEGER,
+    series INTEGER,
+    issued_at TEXT,
+    cnpj TEXT,
+    item_count INTEGER NOT NULL,
+    total_value REAL NOT NULL,
+    imported_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    item INTEGER,
+    description TEXT,
+    quantity REAL,
+    unit TEXT,
+    unit_price REAL,
+    total REAL
+);
+CREATE INDEX IF NOT EXISTS documents_issued_at ON documents(issued_at);
+CREATE INDEX IF NOT EXISTS documents_cnpj ON documents(cnpj, issued_at);
+CREATE INDEX IF NOT EXISTS items_description ON items(description);
+CREATE INDEX IF NOT EXISTS items_document ON items(document_id);
+"""
+
+
+def _nullable(values):
+    # NaN e pd.NA viram NULL no SQLite
+    return [None if value is pd.NA or (isinstance(value, float) and value != value) else value for value in values]
+
+
+class ReceiptStore:
+    # Histórico local das NFC-e extraídas, em um banco SQLite: cabeçalhos em
+    # `documents` e itens em `items`. Cada documento é gravado uma única vez
+    # (pelo hash do arquivo e pela chave de acesso), e as estatísticas são
+    # calculadas por consultas agregadas, sem reler os PDFs.
+
+    def __init__(self, path, memo_size=32):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # Consultas recentes; invalidadas a cada gravação, deste processo
+        # (_revision) ou de outro com o mesmo banco (PRAGMA data_version)
+        self._revision = 0
+        self._memo = LruMemo(memo_size)
+
+    def close(self):
+        self._connection.close()
+
+    def save_documents(self, documents, batch_size=INSERT_BATCH_DOCUMENTS):
+        # documents: iterável de (hash do arquivo, nome, identificação, itens),
+        # com os itens num DataFrame tipado (ver ItemTable.file_frame). Os
+        # documentos já gravados são ignorados. Retorna quantos foram gravados.
+        saved = 0
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                saved += self._save_batch(batch)
+                batch = []
+        if batch:
+            saved += self._save_batch(batch)
+        return saved
+
+    def _save_batch(self, batch):
+        imported_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        saved = 0
+        with self._lock, self._connection:
+            for digest, name, header, items in batch:
+                header = header or {}
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO documents (digest, access_key, file_name, number, series, issued_at, cnpj, item_count, total_value, imported_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        digest, header.get("access_key"), name, header.get("number"), header.get("series"),
+                        header.get("issued_at"), header.get("cnpj"), len(items),
+                        float(np.nan_to_num(items["Vl. total"].to_numpy()).sum()), imported_at,
+                    ),
+                )
+                if not cursor.rowcount:
+                    continue
+                document_id = cursor.lastrowid
+                columns = [
+                    _nullable(items["Item"].tolist()),
+                    items["Descrição"].astype("object").tolist(),
+                    _nullable(items["Qtde."].tolist()),
+                    items["Unid."].astype("object").tolist(),
+                    _nullable(items["Vl. unid."].tolist()),
+                    _nullable(items["Vl. total"].tolist()),
+                ]
+                self._connection.executemany(
+                    "INSERT INTO items (document_id, item, description, quantity, unit, unit_price, total) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((document_id, *row) for row in zip(*columns)),
+                )
+                saved += 1
+            if saved:
+                self._revision += 1
+                self._memo.clear()
+        return saved
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return pd.read_sql_query(sql, self._connection, params=params)
+
+    def _memoized(self, key, compute):
+        with self._lock:
+            data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+            key = (self._revision, data_version, *key)
+        return self._memo.memoize(key, compute)
+
+    def date_range(self):
+        row = self._query("SELECT MIN(issued_at) AS first, MAX(issued_at) AS last FROM documents").iloc[0]
+        return row["first"], row["last"]
+
+    def stores(self):
+        return self._query("SELECT DISTINCT cnpj FROM documents WHERE cnpj IS NOT NULL ORDER BY cnpj")["cnpj"].tolist()
+
+    def _filter(self, digests=None, access_keys=None, start=None, end=None, cnpj=None):
+        # Cláusula WHERE sobre `documents` (alias d); as datas são "AAAA-MM-DD".
+        # Um documento selecionado por `digests` pode ter sido gravado a partir
+        # de outro arquivo com a mesma chave de acesso.
+        conditions = []
+        params = []
+        if digests is not None:
+            conditions.append("(d.digest IN (SELECT value FROM json_each(?)) OR d.access_key IN (SELECT value FROM json_each(?)))")
+            params.append(json.dumps(list(digests)))
+            params.append(json.dumps([access_key for access_key in access_keys or [] if access_key]))
+        if start is not None:
+            conditions.append("d.issued_at >= ?")
+            params.append(str(start))
+        if end is not None:
+            conditions.append("d.issued_at < date(?, '+1 day')")
+            params.append(str(end))
+        if cnpj is not None:
+            conditions.append("d.cnpj = ?")
+            params.append(cnpj)
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def monthly_totals(self, start=None, end=None, cnpj=None):
+        where, params = self._filter(start=start, end=end, cnpj=cnpj)
+        return self._memoized(("monthly", start, end, cnpj), lambda: self._query(
+            "SELECT substr(d.issued_at, 1, 7) AS \"Mês\", COUNT(*) AS \"NFC-e\", SUM(d.total_value) AS \"Valor Total (R$)\""
+            f" FROM documents d{where} GROUP BY 1 ORDER BY 1",
+            params,
+        ))
+
+    def statistics(self, digests=None, access_keys=None, labels=None, start=None, end=None, cnpj=None, top_products=TOP_PRODUCTS):
+        # Mesmas estatísticas de stats.compute_statistics, calculadas no banco.
+        # Com `digests` (e as chaves de acesso correspondentes), restritas a
+        # esses documentos e na mesma ordem; `labels` dá o rótulo de cada um
+        # no gráfico por arquivo.
+        if digests is not None:
+            digests = list(digests)
+            access_keys = list(access_keys) if access_keys is not None else [None] * len(digests)
+            labels = list(labels) if labels is not None else [f"PDF {i+1}" for i in range(len(digests))]
+        key = ("statistics", *(tuple(values) if values is not None else None for values in (digests, access_keys, labels)), start, end, cnpj, top_products)
+        return self._memoized(key, lambda: self._statistics(digests, access_keys, labels, start, end, cnpj, top_products))
+
+    def _statistics(self, digests, access_keys, labels, start, end, cnpj, top_products):
+        where, params = self._filter(digests, access_keys, start, end, cnpj)
+
+        documents = self._query(f"SELECT d.digest, d.access_key, d.file_name, d.item_count, d.total_value FROM documents d{where} ORDER BY d.issued_at, d.id", params)
+        if digests is None:
+            labels = [f"PDF {i+1}" for i in range(len(documents))]
+        else:
+            position = {access_key: index for index, access_key in enumerate(access_keys) if access_key}
+            position.update((digest, index) for index, digest in enumerate(digests))
+            order = [position.get(digest, position.get(access_key)) for digest, access_key in zip(documents["digest"], documents["access_key"])]
+            documents = documents.iloc[np.argsort(order, kind="stable")].reset_index(drop=True)
+            labels = [labels[index] for index in sorted(order)]
+
+        totals = documents["total_value"].to_numpy(dtype="float64")
+        total_sum = float(totals.sum())
+        per_file = pd.DataFrame({
+            "PDF": labels,
+            "Arquivo": documents["file_name"],
+            "Valor Total (R$)": totals,
+            "Contribuição (%)": totals / total_sum * 100 if total_sum else np.zeros(len(totals)),
+        })
+
+        items = f"FROM items i JOIN documents d ON d.id = i.document_id{where}"
+        top = self._query(
+            f"SELECT i.description AS \"Descrição\", SUM(i.total) AS \"Gasto (R$)\", SUM(i.quantity) AS \"Qtde. total\", COUNT(*) AS \"Ocorrências\""
+            f" {items} GROUP BY i.description ORDER BY 2 DESC LIMIT ?",
+            params + [top_products],
+        )
+        # Mediana por janela: média dos elementos centrais de cada descrição
+        unit_prices = self._query(
+            "WITH ranked AS ("
+            " SELECT i.description, i.unit_price,"
+            " ROW_NUMBER() OVER (PARTITION BY i.description ORDER BY i.unit_price IS NULL, i.unit_price) AS position,"
+            " COUNT(i.unit_price) OVER (PARTITION BY i.description) AS priced"
+            f" {items})"
+            " SELECT description AS \"Descrição\", COUNT(*) AS \"Ocorrências\", MIN(unit_price) AS \"Vl. unid. mín.\","
+            " AVG(CASE WHEN position IN ((priced + 1) / 2, (priced + 2) / 2) THEN unit_price END) AS \"Vl. unid. mediano\","
+            " AVG(unit_price) AS \"Vl. unid. médio\", MAX(unit_price) AS \"Vl. unid. máx.\""
+            " FROM ranked GROUP BY description ORDER BY 2 DESC",
+            params,
+        )
+        quantity_by_unit = self._query(
+            f"SELECT i.unit AS \"Unid.\", SUM(i.quantity) AS \"Qtde. total\", COUNT(*) AS \"Itens\", SUM(i.total) AS \"Gasto (R$)\""
+            f" {items} GROUP BY i.unit ORDER BY i.unit",
+            params,
+        )
+
+        return BatchStatistics(
+            file_count=len(documents),
+            item_count=int(documents["item_count"].sum()),
+            total_sum=total_sum,
+            mean_total=float(totals.mean()) if len(totals) else 0.0,
+            min_total=float(totals.min()) if len(totals) else 0.0,
+            max_total=float(totals.max()) if len(totals) else 0.0,
+            per_file=per_file,
+            top_products=top,
+            unit_prices=unit_prices,
+            quantity_by_unit=quantity_by_unit,
+        )
@@ -0,0 +1,253 @@
+from collections import deque
+from dataclasses import dataclass
+from itertools import takewhile
+
+from backends import REFERENCE_BACKEND
+from extractor import NotDanfeError, build_page_map, extract_document_xml, extract_pages, extract_source, get_page_map, is_xml_document, remember_page_map, rows_consistent, sum_total_values
+from profiling import NULL_PROFILER, Profiler
+
+# PDFs com mais páginas que isto são divididos em blocos entre os processos,
+# um por processo e com no mínimo PAGES_PER_TASK páginas: cada tarefa abre o
+# PDF de novo, então blocos pequenos demais custam mais do que rendem
+LARGE_FILE_PAGES = 8
+PAGES_PER_TASK = 4
+
+
+@dataclass
+class FileResult:
+    index: int
+    name: str
+    data: list = None
+    total_value: float = 0
+    header: dict = None
+    error: str = None
+    # Extração interrompida por um limite do modo isolado (ver isolation.py)
+    quarantined: bool = False
+    # PDF rejeitado pela triagem e estimativa do tempo poupado (segundos)
+    rejected: bool = False
+    saved_seconds: float = 0.0
+
+
+def split_source(item):
+    # (nome, origem, hash do conteúdo ou None) de um item de `sources`, que
+    # pode vir só com (nome, origem)
+    name, source, *digest = item
+    return name, source, digest[0] if digest else None
+
+
+def format_error(exc):
+    return f"{type(exc).__name__}: {exc}"
+
+
+def describe_error(exc):
+    # (mensagem, rejeitado pela triagem, segundos poupados) de um erro de extração
+    if isinstance(exc, NotDanfeError):
+        return format_error(exc), True, exc.saved_seconds
+    return format_error(exc), False, 0.0
+
+
+def set_error(result, exc):
+    result.error, result.rejected, result.saved_seconds = describe_error(exc)
+
+
+def extract_task(source, parser=None, backend=None, profile=False, digest=None):
+    # Extração de um documento inteiro em uma única tarefa: a origem pode ser
+    # um caminho ou bytes, de um PDF ou de um XML. Com profile=True devolve
+    # também os eventos medidos, que set_result incorpora ao Profiler.
+    profiler = Profiler() if profile else NULL_PROFILER
+    data, total_value, header = extract_source(source, parser, profiler, backend, digest)
+    return data, total_value, header, profiler.events if profile else []
+
+
+def set_result(result, outcome, profiler):
+    result.data, result.total_value, result.header, events = outcome
+    profiler.extend(events, file=result.name)
+
+
+def read_pages_task(source, page_indexes=None, parser=None, backend=None, profile=False):
+    # Executado no processo filho: um XML inteiro ou, de um PDF, as páginas
+    # indicadas (None: as LARGE_FILE_PAGES primeiras). Retorna (número de
+    # páginas, [(índice, linhas)], página do rodapé, identificação, eventos);
+    # o XML vem como uma única página 0, com o número de páginas None.
+    profiler = Profiler() if profile else NULL_PROFILER
+    if is_xml_document(source):
+        data, _, header = extract_document_xml(source, profiler)
+        outcome = None, [(0, data)], 0, header
+    else:
+        outcome = extract_pages(source, page_indexes, parser, profiler, backend, LARGE_FILE_PAGES)
+    return (*outcome, profiler.events if profile else [])
+
+
+def _page_chunks(page_indexes, workers):
+    page_indexes = list(page_indexes)
+    size = max(PAGES_PER_TASK, -(-len(page_indexes) // workers))
+    return [page_indexes[start:start + size] for start in range(0, len(page_indexes), size)]
+
+
+class PageTask:
+    # Uma chamada de read_pages_task para um documento; `attempt` separa as
+    # tarefas de uma leitura abandonada (ao trocar de leitor) das atuais
+    function = staticmethod(read_pages_task)
+
+    def __init__(self, document, page_indexes):
+        self.document = document
+        self.attempt = document.attempt
+        self.args = (document.source, page_indexes, document.parser, document.backend, document.profile)
+
+    @property
+    def stale(self):
+        return self.document.done or self.attempt != self.document.attempt
+
+
+class DocumentTasks:
+    # Extração de um documento em uma ou mais tarefas. A primeira lê o
+    # documento inteiro (XML, PDF pequeno) ou as primeiras LARGE_FILE_PAGES
+    # páginas de um PDF grande; se o rodapé não estiver nelas, as páginas
+    # restantes são divididas em blocos entre os `workers` processos. As
+    # linhas são juntadas aqui, na ordem das páginas e só até o rodapé. Com um
+    # leitor diferente do de referência, o documento que ele não consegue ler
+    # ou cujas linhas não conferem com o rodapé é lido de novo com o de referência.
+    # Com o hash do conteúdo, o mapa de páginas fica neste processo: na
+    # próxima leitura do mesmo documento, só as páginas com itens são enviadas.
+
+    def __init__(self, index, name, source, digest=None, parser=None, backend=None, profile=False, workers=1):
+        self.result = FileResult(index=index, name=name)
+        self.source = source
+        self.parser = parser
+        self.backend = backend
+        self.profile = profile
+        self.digest = digest
+        self.workers = workers
+        self.done = False
+        self.attempt = 0
+        self._fallback = None
+        self._start()
+
+    def _start(self):
+        self._page_count = None
+        self._pages = []
+        self._footers = []
+        self._page_map = get_page_map(self.digest, self.parser, self.backend) if self.digest else None
+        if self._page_map is None:
+            self._tasks = [PageTask(self, None)]
+        else:
+            item_pages = list(self._page_map.item_pages)
+            chunks = _page_chunks(item_pages, self.workers) if len(item_pages) > LARGE_FILE_PAGES else [item_pages]
+            self._tasks = [PageTask(self, chunk) for chunk in chunks]
+        self._running = len(self._tasks)
+
+    def take_tasks(self):
+        # Tarefas novas, a enviar aos processos
+        tasks, self._tasks = self._tasks, []
+        return tasks
+
+    def complete(self, task, outcome, profiler=NULL_PROFILER):
+        page_count, pages, footer_page, header, events = outcome
+        profiler.extend(events, file=self.result.name)
+        self._running -= 1
+        self._page_count = page_count
+        self._pages.extend(pages)
+        if footer_page is not None:
+            self._footers.append((footer_page, header))
+        if task.args[1] is None:
+            # Primeira tarefa: sem o rodapé nas páginas lidas, dividir as restantes
+            if footer_page is None and page_count is not None and page_count > LARGE_FILE_PAGES:
+                for chunk in _page_chunks(range(LARGE_FILE_PAGES, page_count), self.workers):
+                    self._tasks.append(PageTask(self, chunk))
+                self._running += len(self._tasks)
+        if not self._running:
+            self._merge(profiler)
+
+    def fail(self, error, rejected=False, saved_seconds=0.0, profiler=NULL_PROFILER):
+        if not rejected and self.backend not in (None, REFERENCE_BACKEND) and not is_xml_document(self.source):
+            self._read_again(profiler)
+            return
+        self.stop(error=error, rejected=rejected, saved_seconds=saved_seconds)
+
+    def stop(self, **fields):
+        # Encerrar o documento com o resultado indicado (erro, quarentena)
+        for field, value in fields.items():
+            setattr(self.result, field, value)
+        self._tasks = []
+        self._finish()
+
+    def _read_again(self, profiler):
+        # Ler o documento de novo, desde o início, com o leitor de referência
+        self._fallback = profiler.stage("backend_fallback", file=self.result.name, backend=self.backend)
+        self._fallback.__enter__()
+        self.backend = REFERENCE_BACKEND
+        self.attempt += 1
+        self._start()
+
+    def _merge(self, profiler):
+        footer_page, header = min(self._footers, key=lambda footer: footer[0]) if self._footers else (None, None)
+        pages = sorted((page for page in self._pages if footer_page is None or page[0] <= footer_page), key=lambda page: page[0])
+        data = [row for _, rows in pages for row in rows]
+        if self._page_map is not None and self._page_map.header is not None:
+            # A página do rodapé só é lida de novo se tiver itens
+            header = dict(self._page_map.header)
+        if self._page_count is not None and self.backend not in (None, REFERENCE_BACKEND) and not rows_consistent(data, header):
+            self._read_again(profiler)
+            return
+        with profiler.stage("merge", file=self.result.name) as event:
+            total = sum_total_values(data)
+            event["rows"] = len(data)
+        self.result.data, self.result.total_value, self.result.header = data, total, header
+        if self._page_map is None and self.digest and self._page_count is not None:
+            remember_page_map(self.digest, build_page_map(self._page_count, pages, footer_page, header), self.parser, self.backend)
+        self._finish()
+
+    def _finish(self):
+        self.done = True
+        if self._fallback is not None:
+            self._fallback.__exit__(None, None, None)
+
+
+def iter_scheduled(documents, runner, window, ordered=True, profiler=NULL_PROFILER, quarantine=None):
+    # Resultados (FileResult) de `documents` (DocumentTasks), com no máximo
+    # `window` documentos em andamento, na ordem de entrada ou, com
+    # ordered=False, à medida que cada um termina. `runner` executa as
+    # tarefas, task.function(*task.args): submit(tarefa) e wait(), que espera
+    # ao menos uma terminar e
+    # retorna [(tarefa, situação, conteúdo)], com a situação "ok" (resultado de
+    # read_pages_task), "error" (describe_error) ou, no modo isolado, "limit"
+    # ou "crash" (motivo), que levam o documento para a `quarantine`.
+    in_flight = deque()
+    document_iter = iter(documents)
+    exhausted = False
+    while True:
+        while not exhausted and len(in_flight) < window:
+            document = next(document_iter, None)
+            if document is None:
+                exhausted = True
+                break
+            in_flight.append(document)
+            for task in document.take_tasks():
+                runner.submit(task)
+
+        if ordered:
+            finished = list(takewhile(lambda document: document.done, in_flight))
+        else:
+            finished = [document for document in in_flight if document.done]
+        for document in finished:
+            in_flight.remove(document)
+            yield document.result
+        if finished:
+            continue
+        if not in_flight:
+            return
+
+        for task, status, payload in runner.wait():
+            document = task.document
+            if task.stale:
+                continue
+            if status == "ok":
+                document.complete(task, payload, profiler)
+            elif status == "error":
+                document.fail(*payload, profiler=profiler)
+            else:
+                if quarantine is not None:
+                    quarantine.add(document.digest, document.result.name, payload)
+                document.stop(error=f"Arquivo em quarentena: {payload}", quarantined=True)
+            for new_task in document.take_tasks():
+                runner.submit(new_task)